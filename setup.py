@@ -1,4 +1,4 @@
-from distutils.core import setup, Extension
+from distutils.core import setup
 
 setup(
     name='softrenderer',
@@ -12,9 +12,5 @@ setup(
         'softrenderer.common',
         'softrenderer.debug',
         'softrenderer.render',
-    ],
-    ext_package='softrenderer.cython',
-    ext_modules=[
-        Extension('render_utils', sources=['softrenderer/cython/render_utils.c'])
     ]
 )
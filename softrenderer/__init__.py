@@ -2,6 +2,5 @@
 
 
 from . import common
-from . import cython
 from . import debug
 from . import render
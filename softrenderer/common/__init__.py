@@ -3,6 +3,7 @@
 from . import math
 
 from . import exceptions
+from . import image
 from . import mesh
 from . import primitive
 from . import transform
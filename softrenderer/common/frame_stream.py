@@ -0,0 +1,120 @@
+# -*- coding:utf-8 -*-
+
+
+import queue
+import sys
+import threading
+
+import numpy as np
+
+from softrenderer.common import image
+
+
+class FrameStream:
+    """Streams color buffers to one Y4M or raw RGBA file as they are rendered
+
+    Frames wait in a bounded queue and a writer thread converts and writes them, so encoding overlaps
+    rendering and at most queue_size frames are held whatever the sequence length. write blocks while
+    the queue is full. output is a path, '-' for stdout, or a binary file object.
+    Y4M frames are 4:4:4 BT.601 YCbCr, raw frames are r, g, b, a bytes, both top row first
+    """
+    FORMATS = ('y4m', 'raw')
+
+    def __init__(self, output, width, height, stream_format='y4m', fps=30, queue_size=4):
+        if stream_format not in FrameStream.FORMATS:
+            raise AttributeError('unsupported stream format: %s' % stream_format)
+
+        if queue_size <= 0:
+            raise AttributeError('queue size must be positive')
+
+        self._width = width
+        self._height = height
+        self._format = stream_format
+        self._frame_count = 0
+        self._error = None
+
+        if output == '-':
+            self._file, self._owns_file = sys.stdout.buffer, False
+        elif isinstance(output, str):
+            self._file, self._owns_file = open(output, 'wb'), True
+        else:
+            self._file, self._owns_file = output, False
+
+        if stream_format == 'y4m':
+            self._file.write(b'YUV4MPEG2 W%d H%d F%d:1 Ip A1:1 C444\n' % (width, height, fps))
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def frame_count(self):
+        return self._frame_count
+
+    def write(self, color_buffer):
+        """Queue an [x, y] indexed color buffer, cropped to the stream size and copied since renderers
+        reuse their buffers
+        """
+        self._raise_error()
+        if self._thread is None:
+            raise AttributeError('stream is closed')
+
+        self._queue.put(np.array(color_buffer[:self._width, :self._height], dtype=np.uint32))
+        self._frame_count += 1
+
+    def close(self):
+        """Write the queued frames and close the stream, errors of the writer thread are raised here
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+            if self._owns_file:
+                self._file.close()
+            else:
+                self._file.flush()
+
+        self._raise_error()
+
+    def _writer(self):
+        while True:
+            color_buffer = self._queue.get()
+            if color_buffer is None:
+                return
+
+            if self._error is not None:
+                # keep draining so write never blocks on a dead writer
+                continue
+
+            try:
+                if self._format == 'y4m':
+                    self._file.write(b'FRAME\n')
+                    self._file.write(FrameStream._ycbcr_planes(image.rgba_rows(color_buffer)).tobytes())
+                else:
+                    self._file.write(image.rgba_rows(color_buffer).tobytes())
+            except Exception as e:
+                self._error = e
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    @staticmethod
+    def _ycbcr_planes(rgba):
+        """(3 x height x width) uint8 Y, Cb, Cr planes of rgba rows, BT.601 studio swing
+        """
+        rgb = rgba[:, :, :3].astype(np.float32)
+        r, g, b = rgb[:, :, 0], rgb[:, :, 1], rgb[:, :, 2]
+
+        y = 16 + (65.481 * r + 128.553 * g + 24.966 * b) / 255
+        cb = 128 + (-37.797 * r - 74.203 * g + 112.0 * b) / 255
+        cr = 128 + (112.0 * r - 93.786 * g - 18.214 * b) / 255
+
+        return np.rint(np.stack((y, cb, cr))).astype(np.uint8)
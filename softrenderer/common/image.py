@@ -0,0 +1,56 @@
+# -*- coding:utf-8 -*-
+
+
+import struct
+import zlib
+
+import numpy as np
+
+
+def rgba_rows(color_buffer):
+    """(height x width x 4) uint8 array of the r, g, b, a bytes of an [x, y] indexed RGBA8888 color buffer,
+    top row first
+    """
+    rows = np.ascontiguousarray(np.asarray(color_buffer).T[::-1], dtype='>u4')
+    return rows.view(np.uint8).reshape(rows.shape + (4,))
+
+
+def encode_ppm(color_buffer):
+    """Binary PPM (P6) image of a color buffer, alpha is dropped
+    """
+    rgb = rgba_rows(color_buffer)[:, :, :3]
+    height, width = rgb.shape[:2]
+    return b'P6\n%d %d\n255\n' % (width, height) + rgb.tobytes()
+
+
+def encode_png(color_buffer, compress_level=6):
+    """8 bit RGBA PNG image of a color buffer
+    """
+    rgba = rgba_rows(color_buffer)
+    height, width = rgba.shape[:2]
+
+    # every scanline starts with its filter type, 0 for none
+    scanlines = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    scanlines[:, 1:] = rgba.reshape(height, -1)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', header) \
+        + _png_chunk(b'IDAT', zlib.compress(scanlines.tobytes(), compress_level)) + _png_chunk(b'IEND', b'')
+
+
+def write_image(path, color_buffer):
+    """Write a color buffer to a .png or .ppm file, chosen by extension
+    """
+    if path.lower().endswith('.png'):
+        data = encode_png(color_buffer)
+    elif path.lower().endswith('.ppm'):
+        data = encode_ppm(color_buffer)
+    else:
+        raise AttributeError('unsupported image format: %s' % path)
+
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _png_chunk(chunk_type, data):
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
@@ -2,23 +2,16 @@
 
 
 from math import floor
-from joblib import Parallel, delayed
-import multiprocessing
 
-from softrenderer.common.math.vector import Vector2, Vector3
-from softrenderer.common.types import Color
-from softrenderer.render import shader
-from softrenderer.render import render_context as rc
-
-from softrenderer.cython import render_utils as ru
-
-from softrenderer.debug import profiler
+import numpy as np
 
-CORE_NUM = multiprocessing.cpu_count()
+from softrenderer.common.math.vector import Vector2
+from softrenderer.common.types import Color
+from softrenderer.render import rasterizer
 
 
 class Primitive:
-    pass
+    __slots__ = ()
 
 
 class Point(Primitive):
@@ -129,9 +122,6 @@ class Triangle(Primitive):
         self._v1 = v1
         self._v2 = v2
         self._v3 = v3
-        self._scan_buffer = None
-        self._pixels = None
-        self._properties_gradient = {}
 
     @property
     def v1(self):
@@ -166,161 +156,155 @@ class Triangle(Primitive):
 
         self._v3 = v3
 
+
+class TriangleBatch(Primitive):
+    """Structure of arrays primitive for a batch of triangles
+
+    positions: (triangle_count x 3 x 4) screen space x, y, z, w of the vertices
+    attributes: (triangle_count x 3 x attributes_count) vertex properties after the position
+    setup: rasterizer.TriangleSetup of the batch, areas, edge equations and property gradients
+    bounding_boxes: (triangle_count x 4) min x, min y, max x, max y
+
+    Indexing with an int gives a TriangleView, slices and masks give a new batch
+    """
+    __slots__ = ('_positions', '_attributes', '_setup', '_bounding_boxes')
+
+    def __init__(self, positions, attributes, setup=None, bounding_boxes=None):
+        super().__init__()
+
+        self._positions = positions
+        self._attributes = attributes
+        self._setup = rasterizer.setup_triangles(self.vertices) if setup is None else setup
+        self._bounding_boxes = np.concatenate((positions[:, :, :2].min(axis=1), positions[:, :, :2].max(axis=1)),
+                                              axis=1) if bounding_boxes is None else bounding_boxes
+
+    @classmethod
+    def from_vertices(cls, vertices):
+        """Build a batch from a (triangle_count x 3 x properties_count) array of vertices
+        """
+        return cls(np.ascontiguousarray(vertices[:, :, :4]), np.ascontiguousarray(vertices[:, :, 4:]))
+
+    def __len__(self):
+        return self._positions.shape[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return TriangleView(self, int(index))
+
+        return TriangleBatch(self._positions[index], self._attributes[index],
+                             rasterizer.TriangleSetup(*(field[index] for field in self._setup)),
+                             self._bounding_boxes[index])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield TriangleView(self, index)
+
+    def __str__(self):
+        return 'TriangleBatch(count: %d, properties: %d)' % (len(self), self.properties_count)
+
     @property
-    def pixels(self):
-        return self._pixels
+    def positions(self):
+        return self._positions
 
-    def rasterize(self):
-        self.v1.rasterize()
-        self.v2.rasterize()
-        self.v3.rasterize()
-
-        # sorted by y axis
-        self._v1, self._v2, self._v3 = sorted([self._v1, self._v2, self._v3], key=lambda vertex: vertex.y)
-
-        # init scan buffer
-        self._scan_buffer = [[None, None] for _ in range(self._v3.y - self._v1.y + 1)]
-
-        # calculate properties gradient
-        self._properties_gradient = []
-
-        try:
-            one_over_dx = 1.0 / ((self.v2.x - self.v3.x) * (self.v1.y - self.v3.y)
-                                 - (self.v1.x - self.v3.x) * (self.v2.y - self.v3.y))
-
-            for i in range(rc.RenderContext.instance().each_vertex_properties_count):
-                gx = one_over_dx * ((self.v2[i] - self.v3[i]) * (self.v1.y - self.v3.y)
-                                    - (self.v1[i] - self.v3[i]) * (self.v2.y - self.v3.y))
-                gy = -one_over_dx * ((self.v2[i] - self.v3[i]) * (self.v1.x - self.v3.x)
-                                     - (self.v1[i] - self.v3[i]) * (self.v2.x - self.v3.x))
-                self._properties_gradient.append((gx, gy))
-
-        except ZeroDivisionError:
-            if self.v1.x == self.v2.x == self.v3.x:
-                if self.v1.y >= self.v2.y:
-                    for i in range(rc.RenderContext.instance().each_vertex_properties_count):
-                        self._properties_gradient.append((0,
-                                                          ((self.v3[i] - self.v1[i]) / (self.v3.y - self.v1.y))))
-                else:
-                    for i in range(rc.RenderContext.instance().each_vertex_properties_count):
-                        self._properties_gradient.append((0,
-                                                          ((self.v3[i] - self.v2[i]) / (self.v3.y - self.v2.y))))
-            else:
-                # sorted by x axis
-                self._v1, self._v2, self._v3 = sorted([self._v1, self._v2, self._v3], key=lambda vertex: vertex.x)
-                if self.v1.y >= self.v2.y:
-                    for i in range(rc.RenderContext.instance().each_vertex_properties_count):
-                        self._properties_gradient.append((0,
-                                                          ((self.v3[i] - self.v1[i]) / (self.v3.x - self.v1.x))))
-                else:
-                    for i in range(rc.RenderContext.instance().each_vertex_properties_count):
-                        self._properties_gradient.append((0,
-                                                          ((self.v3[i] - self.v2[i]) / (self.v3.x - self.v2.x))))
-
-        # calculate handedness
-        vector1 = Vector2(self._v3.x - self._v1.x, self._v3.y - self._v1.y)
-        vector2 = Vector2(self._v2.x - self._v1.x, self._v2.y - self._v1.y)
-        handedness = 0 if Vector2.cross(vector1, vector2) < 0 else 1
-
-        # scan edge
-        self._refresh_scan_buffer(self._v1, self._v3, handedness)
-        self._refresh_scan_buffer(self._v1, self._v2, 1 - handedness)
-        self._refresh_scan_buffer(self._v2, self._v3, 1 - handedness)
-
-    def _refresh_scan_buffer(self, min_y_v, max_y_v, handedness):
-        len_y = max_y_v.y - min_y_v.y
-        if len_y == 0:
-            return
-
-        slope = (max_y_v.x - min_y_v.x) / len_y
-        x = min_y_v.x
-        t_slope = 1 / (len_y + 1)
-        t = 0
-
-        for i, y in enumerate(range(min_y_v.y, max_y_v.y + 1)):
-            vertex_properties = []
-            for index in range(2, rc.RenderContext.instance().each_vertex_properties_count):
-                gx, gy = self._properties_gradient[index]
-                value = min_y_v[index] + (gy + gx * slope) * i
-                vertex_properties.append(value)
-
-            vertex_properties[0] = floor(x)
-            vertex_properties[1] = y
-
-            self._scan_buffer[y - self._v1.y][handedness] = vertex_properties
-            x += slope
-            t += t_slope
-
-    def pixel_shading(self, pixel_shader):
-        if not isinstance(pixel_shader, shader.PixelShader):
-            raise TypeError
+    @property
+    def attributes(self):
+        return self._attributes
 
-        self._properties_gradient = self._properties_gradient[:2] + self._properties_gradient[4:]
+    @property
+    def setup(self):
+        return self._setup
 
-        self._pixels = []
-        scan_len = len(self._scan_buffer)
-        pixel_info = Parallel(n_jobs=CORE_NUM)(
-            delayed(Triangle._scan_line_pixel_shading_job2)(*self._scan_buffer[i], self._properties_gradient,
-                                                            pixel_shader) for i in range(0, scan_len))
-        self._pixels += sum(pixel_info, [])
+    @property
+    def gradients(self):
+        return self._setup.gradients
 
-    @staticmethod
-    def _scan_line_pixel_shading_job2(start, end, properties_gradient, pixel_shader):
-        if start is None or end is None:
-            return []
+    @property
+    def bounding_boxes(self):
+        return self._bounding_boxes
 
-        profiler.Profiler.begin('pixel_stage.pixel_shading.scan_x')
-        pixel_info = ru.scan_line_pixel_shading_job(start, end[0], properties_gradient, pixel_shader)
-        pixel_info.append((start[0],
-                           start[1],
-                           start[2],
-                           pixel_shader.main(start).hex()))
-        pixel_info.append((end[0],
-                           end[1],
-                           end[2],
-                           pixel_shader.main(end).hex()))
+    @property
+    def properties_count(self):
+        return self._positions.shape[2] + self._attributes.shape[2]
 
-        profiler.Profiler.end()
+    @property
+    def vertices(self):
+        """(triangle_count x 3 x properties_count) array of all vertex properties, copied
+        """
+        return np.concatenate((self._positions, self._attributes), axis=2)
 
-        return pixel_info
 
-    @staticmethod
-    def _scan_line_pixel_shading_job(start, end, properties_gradient, pixel_shader, pixels):
-        y = start['pos'].y
-        start_x = start['pos'].x
-        end_x = end['pos'].x
+class TriangleView:
+    """View of one triangle of a TriangleBatch, with the accessors of Triangle
+    """
+    __slots__ = ('_batch', '_index')
 
-        for index, pos in enumerate(range(start_x + 1, end_x)):
-            Triangle._pixel_shading_job(start, properties_gradient, index, pos, y, pixel_shader, pixels)
+    def __init__(self, batch, index):
+        self._batch = batch
+        self._index = index
 
-    @staticmethod
-    def _pixel_shading_job(start, properties_gradient, index, x, y, pixel_shader, pixels):
-        profiler.Profiler.begin('pixel_stage.pixel_shading.scan_x.interpolation')
-        pixel_properties = {}
-        #        ru.linear_interpolation(index, start, properties_gradient, pixel_properties)
-        for i, v in start.items():
-            gx, _ = properties_gradient[i]
-            pixel_properties[i] = v + gx * index
+    def __str__(self):
+        return 'TriangleView(%s, %s, %s)' % (self.v1, self.v2, self.v3)
 
-        profiler.Profiler.end()
+    @property
+    def v1(self):
+        return VertexView(self._batch, self._index, 0)
 
-        pixel_properties['pos'].x = x
-        pixel_properties['pos'].y = y
+    @property
+    def v2(self):
+        return VertexView(self._batch, self._index, 1)
+
+    @property
+    def v3(self):
+        return VertexView(self._batch, self._index, 2)
+
+    @property
+    def gradients(self):
+        return self._batch.gradients[self._index]
+
+    @property
+    def bounding_box(self):
+        return self._batch.bounding_boxes[self._index]
+
+
+class VertexView:
+    """View of one vertex of a TriangleBatch, with the accessors of Point
+    """
+    __slots__ = ('_batch', '_index', '_vertex')
+
+    def __init__(self, batch, index, vertex):
+        self._batch = batch
+        self._index = index
+        self._vertex = vertex
+
+    def __str__(self):
+        return 'VertexView(%.5f, %.5f, %.5f)' % (self.x, self.y, self.z)
+
+    def __getitem__(self, index):
+        if index < 4:
+            return self._batch.positions[self._index, self._vertex, index]
+        return self._batch.attributes[self._index, self._vertex, index - 4]
+
+    def __setitem__(self, index, value):
+        if index < 4:
+            self._batch.positions[self._index, self._vertex, index] = value
+        else:
+            self._batch.attributes[self._index, self._vertex, index - 4] = value
 
-        color = pixel_shader.main(pixel_properties)
+    @property
+    def x(self):
+        return self[0]
 
-        profiler.Profiler.begin('pixel_stage.pixel_shading.scan_x.append')
-        pixels.append((pixel_properties['pos'], color))
-        profiler.Profiler.end()
+    @property
+    def y(self):
+        return self[1]
 
-    @staticmethod
-    def _linear_interpolation(vp1, vp2, t):
-        vertex_properties = {}
-        for i, v in vp1.items():
-            vp2_value = vp2[i]
-            vertex_properties[i] = v * (1 - t) + vp2_value * t
+    @property
+    def z(self):
+        return self[2]
 
-        return vertex_properties
+    @property
+    def w(self):
+        return self[3]
 
 
 class Line2d:
@@ -401,7 +385,7 @@ class Triangle2d:
 
     def get_sorted_vector_by_y(self):
         ret = [(self.v1, self.c1), (self.v2, self.c2), (self.v3, self.c3)]
-        return sorted(ret, iey=lambda x: x[0].y)
+        return sorted(ret, key=lambda x: x[0].y)
 
     @property
     def v1(self):
@@ -409,7 +393,7 @@ class Triangle2d:
 
     @v1.setter
     def v1(self, v1):
-        if not isinstance(v1, Vector3):
+        if not isinstance(v1, Vector2):
             raise TypeError
 
         self._v1 = v1
@@ -420,7 +404,7 @@ class Triangle2d:
 
     @v2.setter
     def v2(self, v2):
-        if not isinstance(v2, Vector3):
+        if not isinstance(v2, Vector2):
             raise TypeError
 
         self._v2 = v2
@@ -431,7 +415,7 @@ class Triangle2d:
 
     @v3.setter
     def v3(self, v3):
-        if not isinstance(v3, Vector3):
+        if not isinstance(v3, Vector2):
             raise TypeError
 
         self._v3 = v3
@@ -130,10 +130,7 @@ class Color:
         return cls._Black
 
     def hex(self):
-        return cu.rgb2hex(int(self.r * 255),
-                          int(self.g * 255),
-                          int(self.b * 255),
-                          int(self.a * 255))
+        return cu.pack_rgba(self.r, self.g, self.b, self.a)
 
     def hex_str(self):
         return cu.rgb2hex_str(int(self.r * 255),
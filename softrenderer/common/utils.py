@@ -1,12 +1,34 @@
 # -*- coding: utf-8 -*-
 
 
+import numpy as np
+
+
 def rgb2hex(r, g, b, a):
-    try:
-        return int('%02x%02x%02x%02x' % (r, g, b, a), 16)
-    except Exception:
-        print(1)
+    """Pack 8 bit channels to a RGBA8888 value
+    """
+    return ((r & 0xff) << 24) | ((g & 0xff) << 16) | ((b & 0xff) << 8) | (a & 0xff)
 
 
 def rgb2hex_str(r, g, b, a):
     return '%02x%02x%02x%02x' % (r, g, b, a)
+
+
+def pack_rgba(r, g, b, a):
+    """Pack float channels in [0, 1] to RGBA8888 values, channels out of range are clamped
+
+    Channels may be scalars, an int is returned then, or numpy arrays, packed into an uint32 array
+    """
+    if isinstance(r, np.ndarray):
+        channels = (np.clip(np.array((r, g, b, a), dtype=np.float64), 0.0, 1.0) * 255).astype(np.uint32)
+        return (channels[0] << 24) | (channels[1] << 16) | (channels[2] << 8) | channels[3]
+
+    return (_to_byte(r) << 24) | (_to_byte(g) << 16) | (_to_byte(b) << 8) | _to_byte(a)
+
+
+def _to_byte(value):
+    if value <= 0:
+        return 0
+    if value >= 1:
+        return 255
+    return int(value * 255)
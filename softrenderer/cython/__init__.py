@@ -1,3 +0,0 @@
-#-*- coding:utf-8 -*-
-
-from . import render_utils
@@ -1 +0,0 @@
-python setup.py build_ext --inplace && move softrenderer\cython\*.pyd .
\ No newline at end of file
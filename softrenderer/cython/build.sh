@@ -1 +0,0 @@
-python setup.py build_ext --inplace && mv softrenderer/cython/*.so .
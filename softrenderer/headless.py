@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+import argparse
+import logging
+import os
+import sys
+
+from softrenderer.common import image
+from softrenderer.common.frame_stream import FrameStream
+from softrenderer.common.math.vector import Vector2, Vector3, Vector4
+from softrenderer.common.primitive import Line2d
+from softrenderer.common.transform import Transform
+from softrenderer.common.types import Color
+from softrenderer.debug.profiler import Profiler
+from softrenderer.render.render_context import RenderContext
+from softrenderer.render.triangle_renderer import TriangleRenderer
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Render frames offscreen, no OpenGL or display needed')
+    parser.add_argument('--width', type=int, default=400)
+    parser.add_argument('--height', type=int, default=400)
+    parser.add_argument('--frames', type=int, default=36, help='number of frames to render')
+    parser.add_argument('--output', default='frames',
+                        help='directory the images are written to, or the stream file, - for stdout')
+    parser.add_argument('--format', choices=('png', 'ppm') + FrameStream.FORMATS, default='png',
+                        help='one image per frame, or one y4m or raw rgba stream')
+    parser.add_argument('--fps', type=int, default=30, help='frame rate of y4m streams')
+
+    return parser.parse_args(argv)
+
+
+def render(args, present):
+    """Render the rotating triangle of main.py, present is called with every frame on a background thread
+    while the next one renders
+    """
+    tr = TriangleRenderer(Vector4(0, 0.5, 0, 1),
+                          Vector4(-0.5, -0.5, 0, 1),
+                          Vector4(0.5, -0.5, 0, 1),
+                          Color.blue(),
+                          Color.green(),
+                          Color.red())
+
+    tf = Transform()
+    tf._scale = Vector3(0.8, 0.8, 1)
+    tf.rotate_axis(Vector3.right(), 20)
+    tf.rotate_axis(Vector3.forward(), 30)
+    tr.set_tf(tf)
+
+    RenderContext.set_present_callback(present)
+
+    for frame in range(args.frames):
+        RenderContext.clear()
+
+        RenderContext.draw_line(Line2d(Vector2(0, args.height // 2), Vector2(args.width, args.height // 2)),
+                                Color.red(), Color.red())
+        RenderContext.draw_line(Line2d(Vector2(args.width // 2, 0), Vector2(args.width // 2, args.height)),
+                                Color.green(), Color.green())
+
+        tf.rotate_axis(Vector3.up(), 10)
+        RenderContext.draw(tr)
+
+        RenderContext.swap_buffers()
+
+    RenderContext.wait_present()
+    RenderContext.set_present_callback()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # init logging, stdout may carry a stream
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO)
+
+    # no frame loop to profile
+    Profiler.config(Profiler.DISABLE)
+
+    # init RenderContext, row-major buffers are exactly width x height
+    RenderContext.set_framebuffer_layout(RenderContext.FramebufferLayout.ROW_MAJOR)
+    RenderContext.set_screen_size(args.width, args.height)
+    RenderContext.enable_depth_test(True)
+
+    if args.format in FrameStream.FORMATS:
+        with FrameStream(args.output, args.width, args.height, args.format, args.fps) as stream:
+            render(args, stream.write)
+    else:
+        os.makedirs(args.output, exist_ok=True)
+        paths = iter(os.path.join(args.output, 'frame_%05d.%s' % (frame, args.format))
+                     for frame in range(args.frames))
+        render(args, lambda front_buffer: image.write_image(next(paths), front_buffer))
+    RenderContext.shutdown_workers()
+
+    logging.info('%d frames written to %s' % (args.frames, args.output))
+
+
+if __name__ == '__main__':
+    main()
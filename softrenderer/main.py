@@ -40,6 +40,9 @@ TR.set_tf(TF)
 
 RUNNING = False
 
+# pixels of the last presented frame, ready for glDrawPixels
+FRAME = None
+
 
 def on_glut_main_loop():
     global PRE_FRAME_TIME
@@ -60,6 +63,14 @@ def on_glut_close():
     RUNNING = False
 
 
+def present(front_buffer):
+    global FRAME
+
+    # runs on the presentation thread while the next frame renders, GL calls stay on the GLUT thread.
+    # row-major buffers transpose to contiguous rows, so no copy is made
+    FRAME = ascontiguousarray(front_buffer.transpose())
+
+
 def render(delta_time):
     global TIMER, TR, TF
 
@@ -82,9 +93,12 @@ def render(delta_time):
 
     RenderContext.draw(TR)
 
-    # gl flush
-    glDrawPixels(WIDTH + 1, HEIGHT + 1, GL_RGBA, GL_UNSIGNED_INT_8_8_8_8,
-                 ascontiguousarray(RenderContext.color_buffer().transpose()).data)
+    RenderContext.swap_buffers()
+
+    # gl flush, the latest presented frame
+    frame = FRAME
+    if frame is not None:
+        glDrawPixels(frame.shape[1], frame.shape[0], GL_RGBA, GL_UNSIGNED_INT_8_8_8_8, frame.data)
     glFlush()
 
 
@@ -98,7 +112,10 @@ def main():
     Profiler.config(Profiler.ENABLE)
 
     # init RenderContext
-    RenderContext.set_screen_size(400, 400)
+    RenderContext.set_framebuffer_layout(RenderContext.FramebufferLayout.ROW_MAJOR)
+    RenderContext.set_screen_size(WIDTH, HEIGHT)
+    RenderContext.enable_depth_test(True)
+    RenderContext.set_present_callback(present)
 
     # init glut
     glutInit()
@@ -1,9 +1,13 @@
 # -*- coding:utf-8 -*-
 
 
+from . import command_buffer
 from . import mesh_renderer
+from . import rasterizer
 from . import renderer
 from . import render_context
 from . import shader
 from . import triangle_renderer
 from . import vertex_array
+from . import vertex_layout
+from . import worker_pool
@@ -0,0 +1,64 @@
+# -*- coding:utf-8 -*-
+
+
+class CommandBuffer:
+    """Records binds, state changes and draws of a frame, RenderContext.submit executes them at once
+
+    Methods mirror the RenderContext calls they stand for. depth_key of a draw is its distance to the
+    camera, e.g. view space depth of the object center, draws sharing a state run front to back.
+    Commands are checked when submitted
+    """
+
+    def __init__(self):
+        self._commands = []
+
+    def __len__(self):
+        return len(self._commands)
+
+    @property
+    def commands(self):
+        """Recorded (name, argument) pairs, draws have (instance_count, depth_key) arguments
+        """
+        return self._commands
+
+    def reset(self):
+        self._commands = []
+
+    def bind_vertex_shader(self, shader=None):
+        self._commands.append(('bind_vertex_shader', shader))
+
+    def bind_pixel_shader(self, shader=None):
+        self._commands.append(('bind_pixel_shader', shader))
+
+    def bind_vertex_array(self, vertex_array_id):
+        self._commands.append(('bind_vertex_array', vertex_array_id))
+
+    def set_rasterizer(self, rasterizer_type):
+        self._commands.append(('set_rasterizer', rasterizer_type))
+
+    def set_tile_size(self, tile_size):
+        self._commands.append(('set_tile_size', tile_size))
+
+    def cull_face(self, mode):
+        self._commands.append(('cull_face', mode))
+
+    def front_face(self, mode):
+        self._commands.append(('front_face', mode))
+
+    def enable_depth_test(self, enable=True):
+        self._commands.append(('enable_depth_test', enable))
+
+    def depth_func(self, func):
+        self._commands.append(('depth_func', func))
+
+    def enable_early_z(self, enable=True):
+        self._commands.append(('enable_early_z', enable))
+
+    def draw(self, depth_key=0.0):
+        self._commands.append(('draw', (None, depth_key)))
+
+    def draw_instanced(self, instance_count, depth_key=0.0):
+        if instance_count <= 0:
+            raise AttributeError('instance count must be positive')
+
+        self._commands.append(('draw', (instance_count, depth_key)))
@@ -0,0 +1,284 @@
+# -*- coding:utf-8 -*-
+
+
+from collections import namedtuple
+
+import numpy as np
+
+from softrenderer.common import utils as cu
+
+# rows of the bounding box evaluated at once by the edge function rasterizer
+BLOCK_ROWS = 64
+
+# triangle setup of a batch, see setup_triangles
+TriangleSetup = namedtuple('TriangleSetup', ('areas', 'one_over_areas', 'edges', 'gradients', 'degenerate'))
+
+
+def setup_triangles(vertices):
+    """Triangle setup of a (triangle_count x 3 x properties_count) array of screen space vertices, all at once
+
+    areas: twice the signed area, positive for counter-clockwise triangles
+    one_over_areas: reciprocal of the absolute areas, 0 for degenerate triangles
+    edges: (triangle_count x 3 x 4) edge equations a, b, c and top-left flag, edge i is opposite to vertex i
+        and positive inside whatever the winding
+    gradients: (triangle_count x properties_count x 2) screen space (d/dx, d/dy) of every property,
+        0 for degenerate triangles
+    degenerate: mask of zero area triangles
+    """
+    x, y = vertices[:, :, 0], vertices[:, :, 1]
+    areas = (x[:, 1] - x[:, 0]) * (y[:, 2] - y[:, 0]) - (y[:, 1] - y[:, 0]) * (x[:, 2] - x[:, 0])
+    degenerate = areas == 0
+    one_over_areas = 1.0 / np.where(degenerate, 1, np.abs(areas))
+    one_over_areas[degenerate] = 0
+
+    # edge i goes from vertex i + 1 to vertex i + 2, reversed for clockwise triangles
+    clockwise = (areas < 0)[:, None]
+    start_x, end_x = x[:, [1, 2, 0]], x[:, [2, 0, 1]]
+    start_y, end_y = y[:, [1, 2, 0]], y[:, [2, 0, 1]]
+    start_x, end_x = np.where(clockwise, end_x, start_x), np.where(clockwise, start_x, end_x)
+    start_y, end_y = np.where(clockwise, end_y, start_y), np.where(clockwise, start_y, end_y)
+
+    dx, dy = end_x - start_x, end_y - start_y
+    is_top_left = (dy < 0) | ((dy == 0) & (dx < 0))
+
+    # both directions of an edge are evaluated from the same end point, so triangles sharing an edge
+    # get exactly opposite values on it and leave no cracks
+    from_end = (end_x < start_x) | ((end_x == start_x) & (end_y < start_y))
+    origin_x = np.where(from_end, end_x, start_x)
+    origin_y = np.where(from_end, end_y, start_y)
+    edges = np.stack((-dy, dx, dy * origin_x - dx * origin_y, is_top_left), axis=-1)
+
+    # barycentric weight i is edge i over the area, so is the gradient of its plane
+    gradients = np.einsum('tvp,tvj->tpj', vertices, edges[:, :, :2]) * one_over_areas[:, None, None]
+
+    return TriangleSetup(areas, one_over_areas, edges, gradients, degenerate)
+
+
+def scan_line_rasterize(batch, rect):
+    """Scan line rasterization of a TriangleBatch whose positions are snapped to the pixel grid
+
+    Rows of every triangle are walked between its long edge and its two short edges, spans are filled
+    inclusively inside rect (min_x, min_y, max_x, max_y), max excluded. Properties are evaluated from the
+    gradients of the batch. All triangles of the batch are expanded at once.
+    Return x, y columns, the interpolated properties as a (properties_count x pixel_count) array and
+    the triangle index of every pixel, pixels are ordered by triangle
+    """
+    positions = batch.positions
+    triangle_count = len(batch)
+    if triangle_count == 0:
+        return _empty_pixels(batch.properties_count) + (np.empty(0, dtype=np.intp),)
+
+    # vertices sorted by y
+    order = np.argsort(positions[:, :, 1], axis=1, kind='mergesort')
+    sorted_positions = positions[np.arange(triangle_count)[:, None], order]
+    x1, x2, x3 = sorted_positions[:, 0, 0], sorted_positions[:, 1, 0], sorted_positions[:, 2, 0]
+    y1, y2, y3 = sorted_positions[:, 0, 1], sorted_positions[:, 1, 1], sorted_positions[:, 2, 1]
+
+    # (triangle, row) pairs of the rows inside rect
+    start_y = np.maximum(y1, rect[1]).astype(np.intp)
+    end_y = np.minimum(y3, rect[3] - 1).astype(np.intp)
+    row_counts = np.maximum(end_y - start_y + 1, 0)
+    row_triangles = np.repeat(np.arange(triangle_count), row_counts)
+    ys = start_y[row_triangles] + _expand_offsets(row_counts)
+
+    x1, x2, x3 = x1[row_triangles], x2[row_triangles], x3[row_triangles]
+    y1, y2, y3 = y1[row_triangles], y2[row_triangles], y3[row_triangles]
+
+    # x of the long edge and of the short edges on every row
+    long_x = _edge_x(x1, y1, x3, y3, ys)
+    upper = (ys < y2) | (y3 == y2)
+    short_x = np.where(upper, _edge_x(x1, y1, x2, y2, ys), _edge_x(x2, y2, x3, y3, ys))
+
+    # triangles flat in y cover their longest span
+    flat = y1 == y3
+    long_x = np.where(flat, np.minimum(np.minimum(x1, x2), x3), long_x)
+    short_x = np.where(flat, np.maximum(np.maximum(x1, x2), x3), short_x)
+
+    left = np.maximum(np.floor(np.minimum(long_x, short_x)), rect[0]).astype(np.intp)
+    right = np.minimum(np.floor(np.maximum(long_x, short_x)), rect[2] - 1).astype(np.intp)
+    span_counts = np.maximum(right - left + 1, 0)
+
+    span_index = np.repeat(np.arange(row_triangles.shape[0]), span_counts)
+    xs = left[span_index] + _expand_offsets(span_counts)
+    ys = ys[span_index]
+    triangle_ids = row_triangles[span_index]
+
+    # plane of every property through the first vertex
+    anchors = np.concatenate((positions[:, 0], batch.attributes[:, 0]), axis=1)[triangle_ids]
+    gradients = batch.gradients[triangle_ids]
+    properties = (anchors + gradients[:, :, 0] * (xs - anchors[:, 0])[:, None]
+                  + gradients[:, :, 1] * (ys - anchors[:, 1])[:, None]).T
+    properties[0] = xs
+    properties[1] = ys
+
+    return xs, ys, properties, triangle_ids
+
+
+def _edge_x(x1, y1, x2, y2, ys):
+    """x of the edges from (x1, y1) to (x2, y2) on rows ys, horizontal edges give their start
+    """
+    height = y2 - y1
+    flat = height == 0
+    return x1 + (x2 - x1) * (ys - y1) / np.where(flat, 1, height) * ~flat
+
+
+def _expand_offsets(counts):
+    """0 .. count - 1 for every count, concatenated
+    """
+    return np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+
+def edge_function_rasterize(vertices, rect, edges=None, one_over_area=None):
+    """Half-space rasterization of one triangle
+
+    vertices is a (3 x properties_count) array of screen space vertices, pixels are sampled at their centers
+    inside rect (min_x, min_y, max_x, max_y), max excluded. Edges shared by two triangles are drawn once
+    following the top-left rule. edges and one_over_area come from setup_triangles, they are computed
+    when not given.
+    Return x, y columns and the interpolated properties as a (properties_count x pixel_count) array
+    """
+    if edges is None:
+        setup = setup_triangles(vertices[None])
+        edges, one_over_area = setup.edges[0], setup.one_over_areas[0]
+
+    if one_over_area == 0:
+        return _empty_pixels(vertices.shape[1])
+
+    (x1, y1), (x2, y2), (x3, y3) = vertices[:, :2].tolist()
+    min_x = max(int(np.ceil(min(x1, x2, x3) - 0.5)), rect[0])
+    max_x = min(int(np.floor(max(x1, x2, x3) - 0.5)), rect[2] - 1)
+    min_y = max(int(np.ceil(min(y1, y2, y3) - 0.5)), rect[1])
+    max_y = min(int(np.floor(max(y1, y2, y3) - 0.5)), rect[3] - 1)
+    if min_x > max_x or min_y > max_y:
+        return _empty_pixels(vertices.shape[1])
+
+    sample_x = np.arange(min_x, max_x + 1) + 0.5
+
+    xs, ys, weights = [], [], []
+    for block_y in range(min_y, max_y + 1, BLOCK_ROWS):
+        sample_y = np.arange(block_y, min(block_y + BLOCK_ROWS, max_y + 1)) + 0.5
+
+        # (3 x rows x columns) edge values
+        values = edges[:, 0, None, None] * sample_x[None, None, :] \
+            + edges[:, 1, None, None] * sample_y[None, :, None] \
+            + edges[:, 2, None, None]
+        coverage = ((values > 0) | ((values == 0) & edges[:, 3, None, None].astype(bool))).all(axis=0)
+
+        rows, columns = np.nonzero(coverage)
+        xs.append(columns + min_x)
+        ys.append(rows + block_y)
+        weights.append(values[:, rows, columns])
+
+    xs = np.concatenate(xs)
+    ys = np.concatenate(ys)
+
+    # barycentric coordinates
+    weights = np.concatenate(weights, axis=1) * one_over_area
+
+    properties = vertices.T.dot(weights)
+    properties[0] = xs
+    properties[1] = ys
+
+    return xs, ys, properties
+
+
+def line_rasterize(starts, ends):
+    """Rasterize a batch of lines between integer (line_count x 2) start and end points at once
+
+    Every line steps one pixel along its major axis, the minor axis moves by the integer part of the
+    slope accumulated so far, as Bresenham does.
+    Return x, y columns, the interpolation factor from start to end and the line index of every pixel
+    """
+    starts = np.asarray(starts, dtype=np.intp).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=np.intp).reshape(-1, 2)
+
+    deltas = ends - starts
+    lengths = np.abs(deltas)
+    steps = lengths.max(axis=1)
+
+    line_ids = np.repeat(np.arange(len(starts)), steps + 1)
+    k = _expand_offsets(steps + 1)
+    line_steps = np.maximum(steps, 1)[line_ids]
+
+    # major axis moves every step, minor axis every (major / minor) steps
+    offsets = (k[:, None] * lengths[line_ids]) // line_steps[:, None]
+    pixels = starts[line_ids] + np.sign(deltas[line_ids]) * offsets
+
+    return pixels[:, 0], pixels[:, 1], k / line_steps, line_ids
+
+
+def bin_triangles(positions, tile_size, width, height):
+    """Bin triangles into the screen tiles their bounding boxes overlap
+
+    positions is a (triangle_count x 3 x 2) array of screen space positions.
+    Return a list of (tile rect, triangle ids) for every tile with at least one triangle,
+    triangle ids keep their draw order
+    """
+    tile_count_x = -(-width // tile_size)
+    tile_count_y = -(-height // tile_size)
+
+    bbox_min = np.floor(positions.min(axis=1) - 0.5).astype(np.intp) // tile_size
+    bbox_max = np.floor(positions.max(axis=1) - 0.5).astype(np.intp) // tile_size
+    tile_min = np.maximum(bbox_min, 0)
+    tile_max = np.minimum(bbox_max, [tile_count_x - 1, tile_count_y - 1])
+    spans = np.maximum(tile_max - tile_min + 1, 0)
+
+    # expand every triangle into the (triangle, tile) pairs it covers
+    counts = spans[:, 0] * spans[:, 1]
+    triangle_ids = np.repeat(np.arange(len(positions)), counts)
+    offsets = _expand_offsets(counts)
+    tile_x = tile_min[triangle_ids, 0] + offsets % spans[triangle_ids, 0]
+    tile_y = tile_min[triangle_ids, 1] + offsets // spans[triangle_ids, 0]
+
+    tile_ids = tile_y * tile_count_x + tile_x
+    order = np.argsort(tile_ids, kind='mergesort')
+    tile_ids, triangle_ids = tile_ids[order], triangle_ids[order]
+
+    bins = []
+    unique_ids, starts = np.unique(tile_ids, return_index=True)
+    for tile_id, start, end in zip(unique_ids.tolist(), starts.tolist(), starts[1:].tolist() + [len(tile_ids)]):
+        x = (tile_id % tile_count_x) * tile_size
+        y = (tile_id // tile_count_x) * tile_size
+        bins.append(((x, y, min(x + tile_size, width), min(y + tile_size, height)), triangle_ids[start: end]))
+
+    return bins
+
+
+def _empty_pixels(properties_count):
+    empty = np.empty(0, dtype=np.intp)
+    return empty, empty, np.empty((properties_count, 0))
+
+
+def shade_pixels(xs, ys, properties, pixel_shader, pixel_filter=None, triangle_ids=None):
+    """Shade a batch of pixels produced by any rasterizer
+
+    properties holds x, y, z, 1 / w and the other properties divided by w, as left by screen mapping.
+    pixel_filter(xs, ys, zs) may return a mask of pixels worth shading, e.g. an early depth test.
+    Return x, y, depth and packed color columns. When triangle_ids gives the triangle of every pixel,
+    pixels are shaded at once but returned as a list of such columns per triangle, in triangle order
+    """
+    zs = properties[2].astype(np.float32)
+
+    if pixel_filter is not None and len(xs) > 0:
+        mask = pixel_filter(xs, ys, zs)
+        xs, ys, zs, properties = xs[mask], ys[mask], zs[mask], properties[:, mask]
+        if triangle_ids is not None:
+            triangle_ids = triangle_ids[mask]
+
+    if len(xs) == 0:
+        colors = np.empty(0, dtype=np.uint32)
+    else:
+        # pixel shader receives x, y and the vertex properties after position, screen space interpolation
+        # gives 1 / w and the properties divided by w, one reciprocal per pixel restores them
+        pixel_properties = np.delete(properties, (2, 3), axis=0)
+        pixel_properties[2:] *= 1.0 / properties[3]
+
+        colors = np.asarray(pixel_shader.main_batch(pixel_properties))
+        if colors.dtype != np.uint32:
+            colors = cu.pack_rgba(*colors[:4])
+
+    if triangle_ids is None:
+        return xs, ys, zs, colors
+
+    bounds = np.flatnonzero(np.diff(triangle_ids)) + 1
+    return list(zip(np.split(xs, bounds), np.split(ys, bounds), np.split(zs, bounds), np.split(colors, bounds)))
@@ -2,19 +2,22 @@
 
 
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 
 from numpy import *
 
 from softrenderer.common import primitive as pr
+from softrenderer.common import utils as cu
 from softrenderer.common.exceptions import IndexBufferCountError
-from softrenderer.common.math.vector import Vector2
-from softrenderer.cython import render_utils as ru
 from softrenderer.debug import profiler
+from softrenderer.render import rasterizer as rs
 from softrenderer.render import renderer as rd
 from softrenderer.render.shader import VertexShader, PixelShader
 from softrenderer.render.shader import _DefaultPixelShader
 from softrenderer.render.shader import _DefaultVertexShader
+from softrenderer.render.vertex_layout import VertexLayout
+from softrenderer.render.worker_pool import WorkerPool
 
 
 class RenderContext:
@@ -30,22 +33,101 @@ class RenderContext:
     class BufferType(Enum):
         ARRAY_BUFFER = 1
         ELEMENT_ARRAY_BUFFER = 2
+        INSTANCE_ARRAY_BUFFER = 3
+
+    class FramebufferLayout(Enum):
+        COLUMN_MAJOR = 1
+        ROW_MAJOR = 2
+
+    class RasterizerType(Enum):
+        SCAN_LINE = 1
+        EDGE_FUNCTION = 2
+        TILED = 3
+
+    class CullFace(Enum):
+        NONE = 1
+        BACK = 2
+        FRONT = 3
+
+    class FrontFace(Enum):
+        CCW = 1
+        CW = 2
+
+    class DepthFunc(Enum):
+        NEVER = 1
+        LESS = 2
+        EQUAL = 3
+        LEQUAL = 4
+        GREATER = 5
+        NOTEQUAL = 6
+        GEQUAL = 7
+        ALWAYS = 8
+
+    _EARLY_Z_DEPTH_FUNC = (DepthFunc.NEVER, DepthFunc.LESS, DepthFunc.LEQUAL, DepthFunc.GREATER, DepthFunc.GEQUAL)
+
+    # depth functions whose result does not depend on draw order, with the depth key sign that sorts
+    # the draws most likely to pass first. Draws with other functions keep their order when submitted
+    _DEPTH_SORT_ORDER = {DepthFunc.LESS: 1, DepthFunc.LEQUAL: 1, DepthFunc.GREATER: -1, DepthFunc.GEQUAL: -1}
+
+    _CLIP_PLANE_BITS = array([1 << i for i in range(7)])
+    _CLIP_MIN_W = 1e-5
+
+    # floats per instance in the instance array buffer, model matrix and tint
+    _INSTANCE_STRIDE = 20
+
+    # states a command buffer can set, with the attribute holding them
+    _SUBMIT_STATES = (('bind_vertex_shader', '_vertex_shader'),
+                      ('bind_pixel_shader', '_pixel_shader'),
+                      ('set_rasterizer', '_rasterizer'),
+                      ('set_tile_size', '_tile_size'),
+                      ('cull_face', '_cull_face'),
+                      ('front_face', '_front_face'),
+                      ('enable_depth_test', '_depth_test'),
+                      ('depth_func', '_depth_func'),
+                      ('enable_early_z', '_early_z'),
+                      ('bind_vertex_array', '_current_bind_vertex_array_id'))
 
     _instance = None
 
     def __init__(self):
+        # back buffer rendered into and front buffer presented
         self._color_buffer = None
+        self._color_buffer2 = None
+        self._depth_buffer = None
+
+        # storage of color and depth buffers, always indexed [x, y]
+        self._framebuffer_layout = RenderContext.FramebufferLayout.COLUMN_MAJOR
+
+        # presentation of the front buffer, on a background thread
+        self._present_callback = None
+        self._present_executor = None
+        self._present_future = None
+
+        # rasterizer
+        self._rasterizer = RenderContext.RasterizerType.SCAN_LINE
+        self._tile_size = 64
+
+        # face culling
+        self._cull_face = RenderContext.CullFace.NONE
+        self._front_face = RenderContext.FrontFace.CCW
+
+        # depth test
+        self._depth_test = False
+        self._depth_func = RenderContext.DepthFunc.LESS
+        self._early_z = True
+        self._clear_depth = 1.0
 
         # shader
         self._vertex_shader = _DefaultVertexShader()
         self._pixel_shader = _DefaultPixelShader()
 
-        # init vertex array buffer
+        # init vertex array buffer, every vertex array records its buffer bindings and array buffer layout
         self._vertex_array = {}
+        self._vertex_array_layout = {}
         self._vertex_array_id_set = [_ for _ in range(1, 257)]
         self._current_bind_vertex_array_id = -1
 
-        # init buffer
+        # init buffer, buffer objects are stored by id
         self._buffers = {}
         self._bind_buffer_id_map = {}
         self._buffers_id_set = [_ for _ in range(1, 257)]
@@ -56,6 +138,9 @@ class RenderContext:
         self._vertex_count = 0
         self._each_vertex_properties_count = 0
 
+        # workers for triangle traversal and pixel shading
+        self._worker_pool = WorkerPool()
+
     @classmethod
     def instance(cls):
         if cls._instance is None:
@@ -64,11 +149,44 @@ class RenderContext:
 
     @classmethod
     def set_screen_size(cls, width, height):
+        cls.instance()._wait_present()
+
         RenderContext._Width = width
         RenderContext._Height = height
 
-        cls.instance()._color_buffer = zeros((width + 1, height + 1), dtype=uint32)
-        cls.instance()._color_buffer2 = zeros((width + 1, height + 1), dtype=uint32)
+        if cls.instance()._framebuffer_layout == RenderContext.FramebufferLayout.ROW_MAJOR:
+            # (height x width) C-contiguous storage, buffers are its transposed [x, y] views and their
+            # transpose presents with no copy
+            cls.instance()._color_buffer = zeros((height, width), dtype=uint32).T
+            cls.instance()._color_buffer2 = zeros((height, width), dtype=uint32).T
+            cls.instance()._depth_buffer = full((height, width), cls.instance()._clear_depth, dtype=float32).T
+        else:
+            cls.instance()._color_buffer = zeros((width + 1, height + 1), dtype=uint32)
+            cls.instance()._color_buffer2 = zeros((width + 1, height + 1), dtype=uint32)
+            cls.instance()._depth_buffer = full((width + 1, height + 1), cls.instance()._clear_depth, dtype=float32)
+
+    @classmethod
+    def set_framebuffer_layout(cls, layout):
+        """Set the storage of color and depth buffers, buffers are reallocated and cleared
+
+        COLUMN_MAJOR stores (width + 1 x height + 1) arrays. ROW_MAJOR stores C-contiguous (height x width)
+        arrays, transposing a color buffer then gives rows ready for presentation without a copy.
+        Buffers are indexed [x, y] in both layouts
+        """
+        if not isinstance(layout, RenderContext.FramebufferLayout):
+            raise TypeError
+
+        cls.instance()._framebuffer_layout = layout
+        if cls.instance()._color_buffer is not None:
+            cls.set_screen_size(RenderContext._Width, RenderContext._Height)
+
+    @classmethod
+    def width(cls):
+        return RenderContext._Width
+
+    @classmethod
+    def height(cls):
+        return RenderContext._Height
 
     @classmethod
     def gen_buffers(cls, count):
@@ -78,10 +196,11 @@ class RenderContext:
             if count > len(cls.instance()._buffers_id_set):
                 raise AttributeError('no enough buffers')
 
-            if count == 1:
-                return cls.instance()._buffers_id_set.pop()
-            else:
-                return [cls.instance()._buffers_id_set.pop() for _ in range(count)]
+            buffer_ids = [cls.instance()._buffers_id_set.pop() for _ in range(count)]
+            for buffer_id in buffer_ids:
+                cls.instance()._buffers[buffer_id] = None
+
+            return buffer_ids[0] if count == 1 else buffer_ids
 
     @classmethod
     def delete_buffers(cls, *args):
@@ -93,6 +212,10 @@ class RenderContext:
                 del cls.instance()._buffers[buffer_id]
                 cls.instance()._buffers_id_set.append(buffer_id)
 
+                for buffer_type, bind_buffer_id in list(cls.instance()._bind_buffer_id_map.items()):
+                    if bind_buffer_id == buffer_id:
+                        del cls.instance()._bind_buffer_id_map[buffer_type]
+
     @classmethod
     def bind_buffer(cls, buffer_type, buffer_id):
         if buffer_id < 0:
@@ -105,7 +228,7 @@ class RenderContext:
         cls.instance()._bind_buffer_id_map[buffer_type] = buffer_id
 
         # bind buffer for vertex array
-        if cls.instance()._current_bind_vertex_array_id >= 0:
+        if cls.instance()._current_bind_vertex_array_id > 0:
             if cls.instance()._current_bind_vertex_array_id not in cls.instance()._vertex_array:
                 cls.instance()._vertex_array[cls.instance()._current_bind_vertex_array_id] = {buffer_type: buffer_id}
             else:
@@ -113,10 +236,84 @@ class RenderContext:
 
     @classmethod
     def buffer_data(cls, buffer_type, data):
+        """Store data in the buffer bound to buffer_type
+
+        numpy arrays and other buffer protocol objects are kept without copying
+        """
         if not isinstance(buffer_type, RenderContext.BufferType):
             raise TypeError
 
-        cls.instance()._buffers[buffer_type] = data
+        buffer_id = cls.instance()._bound_buffer_id(buffer_type)
+
+        if buffer_type == RenderContext.BufferType.ELEMENT_ARRAY_BUFFER:
+            data = RenderContext._as_index_array(data)
+        elif not isinstance(data, (list, tuple, ndarray)):
+            # raise TypeError for objects not supporting the buffer protocol
+            memoryview(data)
+
+        cls.instance()._buffers[buffer_id] = data
+
+    @classmethod
+    def buffer_sub_data(cls, buffer_type, offset, data):
+        """Overwrite part of the buffer bound to buffer_type, starting at offset
+
+        offset and data count items of the stored buffer, list items, array elements or bytes of other
+        buffer protocol objects. The range must lie inside the buffer, buffers never grow
+        """
+        if not isinstance(buffer_type, RenderContext.BufferType):
+            raise TypeError
+
+        buffer_id = cls.instance()._bound_buffer_id(buffer_type)
+        buffer = cls.instance()._buffers[buffer_id]
+        if buffer is None:
+            raise AttributeError('buffer %d has no data' % buffer_id)
+
+        if buffer_type == RenderContext.BufferType.ELEMENT_ARRAY_BUFFER:
+            data = RenderContext._as_index_array(data)
+            if data.dtype.itemsize > buffer.dtype.itemsize:
+                raise TypeError('indices do not fit the index buffer type')
+
+        if isinstance(buffer, tuple):
+            # tuples are immutable, store a list once
+            buffer = cls.instance()._buffers[buffer_id] = list(buffer)
+
+        if isinstance(buffer, list):
+            target = buffer
+        elif isinstance(buffer, ndarray):
+            target = buffer.reshape(-1)
+            if not may_share_memory(target, buffer):
+                raise TypeError('buffer is not contiguous')
+        else:
+            target = memoryview(buffer).cast('B')
+            data = memoryview(data).cast('B')
+
+        if offset < 0 or offset + len(data) > len(target):
+            raise AttributeError('range [%d, %d) out of buffer of size %d' % (offset, offset + len(data), len(target)))
+
+        target[offset: offset + len(data)] = data
+
+    def _bound_buffer_id(self, buffer_type):
+        """Id of the buffer bound to buffer_type, looked up in the bound vertex array first
+        """
+        vertex_array = self._vertex_array.get(self._current_bind_vertex_array_id, {})
+        buffer_id = vertex_array.get(buffer_type, self._bind_buffer_id_map.get(buffer_type))
+        if buffer_id not in self._buffers:
+            raise AttributeError('no buffer bound to %s' % buffer_type)
+
+        return buffer_id
+
+    @staticmethod
+    def _as_index_array(data):
+        """Index buffers are stored as uint16 or uint32 arrays, unsigned integer arrays are kept as they are
+        """
+        if isinstance(data, ndarray) and data.dtype in (uint16, uint32) and data.ndim == 1:
+            return data
+
+        indices = asarray(data).ravel()
+        if indices.size > 0 and (indices.dtype.kind not in 'ui' or indices.min() < 0):
+            raise TypeError('index buffer must hold non negative integers')
+
+        return indices.astype(uint16 if indices.size == 0 or indices.max() <= 0xffff else uint32)
 
     @classmethod
     def gen_vertex_array(cls, count):
@@ -139,6 +336,7 @@ class RenderContext:
         for vertex_array_id in args:
             if vertex_array_id in cls.instance()._vertex_array:
                 del cls.instance()._vertex_array[vertex_array_id]
+                cls.instance()._vertex_array_layout.pop(vertex_array_id, None)
                 cls.instance()._vertex_array_id_set.append(vertex_array_id)
 
     @classmethod
@@ -146,19 +344,104 @@ class RenderContext:
         if vertex_array_id < 0:
             raise AttributeError('id invalid')
 
-        cls._current_bind_vertex_array_id = vertex_array_id
+        cls.instance()._current_bind_vertex_array_id = vertex_array_id
+
+    @classmethod
+    def bound_vertex_array(cls):
+        """Id of the bound vertex array, 0 if there is none
+        """
+        vertex_array_id = cls.instance()._current_bind_vertex_array_id
+        return vertex_array_id if vertex_array_id > 0 else 0
 
     @classmethod
     def bind_array_buffer_layout(cls, layout):
-        cls.instance()._array_buffer_layout = layout
+        """Bind the layout of the array buffer
+
+        Either a list of float component counts per attribute, e.g. [4, 4], or a VertexLayout
+        describing dtype, stride and offset of each attribute. The layout belongs to the bound vertex array
+        if there is one
+        """
+        if cls.instance()._current_bind_vertex_array_id > 0:
+            cls.instance()._vertex_array_layout[cls.instance()._current_bind_vertex_array_id] = layout
+        else:
+            cls.instance()._array_buffer_layout = layout
 
     @classmethod
     def delete_array_buffer_layout(cls):
         cls.instance()._array_buffer_layout = None
 
+    @classmethod
+    def set_worker_count(cls, count=None):
+        """Set rendering worker count, None means one worker per cpu core
+        """
+        cls.instance()._worker_pool.worker_count = count
+
+    @classmethod
+    def worker_count(cls):
+        return cls.instance()._worker_pool.worker_count
+
+    @classmethod
+    def shutdown_workers(cls):
+        cls.instance()._worker_pool.shutdown()
+
+    @classmethod
+    def set_rasterizer(cls, rasterizer_type):
+        if not isinstance(rasterizer_type, RenderContext.RasterizerType):
+            raise TypeError
+
+        cls.instance()._rasterizer = rasterizer_type
+
+    @classmethod
+    def set_tile_size(cls, tile_size):
+        """Set the screen tile size of the tiled rasterizer, in pixels
+        """
+        if not isinstance(tile_size, (int, integer)):
+            raise TypeError('tile size must be an integer')
+
+        if tile_size <= 0:
+            raise AttributeError('tile size must be positive')
+
+        cls.instance()._tile_size = tile_size
+
+    @classmethod
+    def cull_face(cls, mode):
+        if not isinstance(mode, RenderContext.CullFace):
+            raise TypeError
+
+        cls.instance()._cull_face = mode
+
+    @classmethod
+    def front_face(cls, mode):
+        if not isinstance(mode, RenderContext.FrontFace):
+            raise TypeError
+
+        cls.instance()._front_face = mode
+
+    @classmethod
+    def enable_depth_test(cls, enable=True):
+        cls.instance()._depth_test = enable
+
+    @classmethod
+    def depth_func(cls, func):
+        if not isinstance(func, RenderContext.DepthFunc):
+            raise TypeError
+
+        cls.instance()._depth_func = func
+
+    @classmethod
+    def enable_early_z(cls, enable=True):
+        """Reject hidden pixels before pixel shading, only for depth functions where it is safe
+        """
+        cls.instance()._early_z = enable
+
+    @classmethod
+    def clear_depth(cls, depth):
+        cls.instance()._clear_depth = depth
+
     @classmethod
     def clear(cls):
         cls.instance()._clear_color_buffer()
+        cls.instance()._clear_depth_buffer()
 
     @classmethod
     def bind_vertex_shader(cls, shader=None):
@@ -178,6 +461,28 @@ class RenderContext:
     def draw(cls, *args):
         cls.instance()._draw(*args)
 
+    @classmethod
+    def draw_instanced(cls, instance_count):
+        """Draw instance_count instances of the bound vertex array in one pass
+
+        The buffer bound to INSTANCE_ARRAY_BUFFER holds 20 floats per instance, a row-major 4x4 model
+        matrix followed by an rgba tint. Model matrices transform the vertex positions and tints multiply
+        the four properties after the position, before vertex shading
+        """
+        cls.instance()._draw_instanced(instance_count)
+
+    @classmethod
+    def submit(cls, command_buffer):
+        """Execute a recorded CommandBuffer
+
+        Draws are sorted by shaders and state, front to back by depth key inside a state, back to front for
+        GREATER and GEQUAL depth tests, and draws sharing a state run as one geometry and rasterizer pass.
+        Binds not changing the current state are dropped. Draws with depth test off or a depth function
+        other than LESS, LEQUAL, GREATER and GEQUAL keep their place, nothing is reordered across them.
+        Return the number of passes run
+        """
+        return cls.instance()._submit(command_buffer)
+
     @classmethod
     def draw_pixel(cls, x, y, color):
         cls.instance()._draw_pixel(x, y, color)
@@ -186,6 +491,15 @@ class RenderContext:
     def draw_line(cls, line, start_color, end_color):
         cls.instance()._draw_line(line, start_color, end_color)
 
+    @classmethod
+    def draw_lines(cls, starts, ends, start_colors, end_colors):
+        """Draw a batch of lines at once
+
+        starts and ends are (line_count x 2) pixel positions, start_colors and end_colors are
+        (line_count x 4) rgba colors, or one rgba color for all lines, interpolated along every line
+        """
+        cls.instance()._draw_lines(starts, ends, start_colors, end_colors)
+
     @classmethod
     def draw_triangle(cls, triangle):
         cls.instance()._draw_triangle(triangle)
@@ -194,6 +508,37 @@ class RenderContext:
     def color_buffer(cls):
         return cls.instance()._get_color_buffer()
 
+    @classmethod
+    def depth_buffer(cls):
+        return cls.instance()._depth_buffer
+
+    @classmethod
+    def front_buffer(cls):
+        return cls.instance()._color_buffer2
+
+    @classmethod
+    def set_present_callback(cls, callback=None):
+        """Set the function presenting frames, swap_buffers calls it with the front buffer on a background
+        thread, e.g. to transpose and upload it or to write it to a file
+        """
+        cls.instance()._wait_present()
+        cls.instance()._present_callback = callback
+
+    @classmethod
+    def swap_buffers(cls):
+        """Swap back and front buffers and start presenting the new front buffer
+
+        The next frame renders into the back buffer while the front buffer is presented. The previous
+        presentation is waited for first, since its buffer becomes the back buffer
+        """
+        cls.instance()._swap_buffers()
+
+    @classmethod
+    def wait_present(cls):
+        """Wait until the last presentation is done, errors of the present callback are raised here
+        """
+        cls.instance()._wait_present()
+
     @property
     def vertex_count(self):
         return self._vertex_count
@@ -205,6 +550,20 @@ class RenderContext:
     def _get_color_buffer(self):
         return self._color_buffer
 
+    def _swap_buffers(self):
+        self._wait_present()
+        self._color_buffer, self._color_buffer2 = self._color_buffer2, self._color_buffer
+
+        if self._present_callback is not None:
+            if self._present_executor is None:
+                self._present_executor = ThreadPoolExecutor(max_workers=1)
+            self._present_future = self._present_executor.submit(self._present_callback, self._color_buffer2)
+
+    def _wait_present(self):
+        if self._present_future is not None:
+            future, self._present_future = self._present_future, None
+            future.result()
+
     def _draw(self, *args):
         argv_len = len(args)
         if argv_len == 1:
@@ -214,26 +573,124 @@ class RenderContext:
             else:
                 raise TypeError
         elif argv_len == 0:
-            if self._vertex_shader is None:
-                logging.error("[Render Error] vertex_shader is None")
-                return
-
-            if self._pixel_shader is None:
-                logging.error("[Render Error] fragment_shader is None")
-                return
-
-            # geometry stage
-            profiler.Profiler.begin("geometry_stage")
-            array_buffer = self._geometry_stage()
-            profiler.Profiler.end()
-
-            # rasterizer stage
-            profiler.Profiler.begin("pixel_stage")
-            self._rasterizer_stage(array_buffer)
-            profiler.Profiler.end()
+            self._draw_elements()
         else:
             raise TypeError('takes 0 or 1 positional argument but %d were given' % argv_len)
 
+    def _draw_instanced(self, instance_count):
+        if instance_count <= 0:
+            raise AttributeError('instance count must be positive')
+
+        self._draw_elements(instance_count)
+
+    def _draw_elements(self, instance_count=None):
+        self._draw_vertices(*self._vertex_input(instance_count))
+
+    def _draw_vertices(self, vertices, index_buffer, source_buffer=None):
+        if self._vertex_shader is None:
+            logging.error("[Render Error] vertex_shader is None")
+            return
+
+        if self._pixel_shader is None:
+            logging.error("[Render Error] fragment_shader is None")
+            return
+
+        # geometry stage
+        profiler.Profiler.begin("geometry_stage")
+        array_buffer, triangle_indices = self._geometry_stage(vertices, index_buffer, source_buffer)
+        profiler.Profiler.end()
+
+        # rasterizer stage
+        profiler.Profiler.begin("pixel_stage")
+        self._rasterizer_stage(array_buffer, triangle_indices)
+        profiler.Profiler.end()
+
+    def _submit(self, command_buffer):
+        # replay state commands to find the state of every draw
+        state = {name: getattr(self, attribute) for name, attribute in RenderContext._SUBMIT_STATES}
+        draws = []
+        for name, argument in command_buffer.commands:
+            if name == 'draw':
+                draws.append((dict(state), ) + argument)
+            elif name in state:
+                state[name] = argument
+            else:
+                raise AttributeError('unknown command %s' % name)
+
+        # sort key: segment between draws depending on draw order, state group, depth. Depth tests
+        # passing greater depths run back to front
+        profiler.Profiler.begin('submit.sort')
+        groups = {}
+        keys = []
+        segment = 0
+        for index, (draw_state, _, depth_key) in enumerate(draws):
+            order = RenderContext._DEPTH_SORT_ORDER.get(draw_state['depth_func'], 0) \
+                if draw_state['enable_depth_test'] else 0
+            segment += 0 if order else 1
+            group = groups.setdefault((segment, RenderContext._state_key(draw_state)), len(groups))
+            keys.append((group, depth_key * order, index))
+            segment += 0 if order else 1
+        keys.sort()
+        profiler.Profiler.end()
+
+        # consecutive draws of one group are merged
+        passes = 0
+        batch = []
+        for position, (group, _, index) in enumerate(keys):
+            batch.append(draws[index])
+            if position + 1 == len(keys) or keys[position + 1][0] != group:
+                passes += self._submit_batch(batch)
+                batch = []
+
+        self._apply_state(state)
+
+        return passes
+
+    @staticmethod
+    def _state_key(state):
+        """Hashable state of a draw, shaders compared by identity, vertex array left out
+        """
+        return tuple(id(value) if name in ('bind_vertex_shader', 'bind_pixel_shader') else value
+                     for name, value in state.items() if name != 'bind_vertex_array')
+
+    def _apply_state(self, state):
+        """Bind every state differing from the current one
+        """
+        for name, attribute in RenderContext._SUBMIT_STATES:
+            value = state[name]
+            current = getattr(self, attribute)
+            if value is not current and value != current:
+                getattr(RenderContext, name)(value)
+
+    def _submit_batch(self, batch):
+        """Draw a batch of draws sharing one state, their vertices concatenated when their property
+        counts match. Return the number of passes run
+        """
+        passes = 0
+        inputs = []
+        for draw_state, instance_count, _ in batch:
+            self._apply_state(draw_state)
+            vertices, index_buffer, source_buffer = self._vertex_input(instance_count)
+            if len(inputs) > 0 and inputs[-1][0].shape[1] != vertices.shape[1]:
+                passes += self._draw_merged(inputs)
+                inputs = []
+            inputs.append((vertices, index_buffer, source_buffer))
+
+        return passes + self._draw_merged(inputs)
+
+    def _draw_merged(self, inputs):
+        if len(inputs) == 1:
+            self._draw_vertices(*inputs[0])
+            return 1
+
+        offsets = cumsum([0] + [vertices.shape[0] for vertices, _, _ in inputs[:-1]])
+        vertices = concatenate([vertices for vertices, _, _ in inputs])
+        index_buffer = concatenate([index_buffer.astype(int64) + offset
+                                    for (_, index_buffer, _), offset in zip(inputs, offsets)])
+        self._draw_vertices(vertices, index_buffer)
+
+        return 1
+
     def _draw_pixel(self, x, y, color):
         if color.is_valid():
             self._set_pixel(x, y, color)
@@ -243,309 +700,482 @@ class RenderContext:
                                                                                    color1,
                                                                                    color2))
 
-        (ret, line) = self._cohen_sutherland_line_clip(line, Vector2.zero(),
-                                                       Vector2(RenderContext._Width, RenderContext._Height))
-
-        if not ret:
-            logging.debug('[Log]Line was aborted')
-            return
-        else:
-            logging.debug('[Log]Will draw line %s' % line)
-
-        (x1, y1) = (line.start.x, line.start.y)
-        (x2, y2) = (line.end.x, line.end.y)
-
-        # draw a pixel
-        if x1 == x2 and y1 == y2:
-            self._draw_pixel(x1, y1, color1)
-        # draw a vertical line
-        elif x1 == x2:
-            inc = 1 if y1 <= y2 else -1
-            t = 0 if y1 <= y2 else 1
-            t_span = 1 / (y2 - y1) * inc
-            for y in range(y1, y2 + inc, inc):
-                if color1 == color2:
-                    color = color1
-                else:
-                    color = color1 * (1 - t) + color2 * t
-                self._draw_pixel(x1, y, color)
-                t += t_span
-
-        # draw a horizontal line
-        elif y1 == y2:
-            inc = 1 if x1 <= x2 else -1
-            t = 0 if x1 <= x2 else 1
-            t_span = 1 / (x2 - x1) * inc
-            for x in range(x1, x2 + inc, inc):
-                if color1 == color2:
-                    color = color1
-                else:
-                    color = color1 * (1 - t) + color2 * t
-                self._draw_pixel(x, y1, color)
-                t += t_span
-        else:
-            dx = x2 - x1 if x1 < x2 else x1 - x2
-            dy = y2 - y1 if y1 < y2 else y1 - y2
-
-            if dx >= dy:
-                if x2 < x1:
-                    x1, x2 = x2, x1
-                    y1, y2 = y2, y1
-
-                y = y1
-                rem = 0
-                t = 0
-                t_span = 1 / (x2 - x1)
-                for x in range(x1, x2 + 1):
-                    if color1 == color2:
-                        color = color1
-                    else:
-                        color = color1 * (1 - t) + color2 * t
-                    self._draw_pixel(x, y, color)
-                    t += t_span
-                    rem += dy
-                    if rem >= dx:
-                        rem -= dx
-                        y += 1 if y2 >= y1 else -1
-                self._draw_pixel(x2, y2, color2)
-            else:
-                if y2 < y1:
-                    x1, x2 = x2, x1
-                    y1, y2 = y2, y1
-
-                x = x1
-                rem = 0
-                t = 0
-                t_span = 1 / (y2 - y1)
-                for y in range(y1, y2 + 1):
-                    if color1 == color2:
-                        color = color1
-                    else:
-                        color = color1 * (1 - t) + color2 * t
-                    self._draw_pixel(x, y, color)
-                    t += t_span
-                    rem += dx
-                    if rem >= dy:
-                        rem -= dy
-                        x += 1 if x2 >= x1 else -1
-                self._draw_pixel(x2, y2, color2)
+        self._draw_lines([[line.start.x, line.start.y]], [[line.end.x, line.end.y]],
+                         [color1.r, color1.g, color1.b, color1.a], [color2.r, color2.g, color2.b, color2.a])
+
+    def _draw_lines(self, starts, ends, start_colors, end_colors):
+        starts = floor(asarray(starts, dtype=float64)).reshape(-1, 2)
+        ends = floor(asarray(ends, dtype=float64)).reshape(-1, 2)
+        if starts.shape != ends.shape:
+            raise AttributeError('starts and ends must hold the same number of points')
+
+        # one color is shared by all lines
+        start_colors = broadcast_to(asarray(start_colors, dtype=float64).reshape(-1, 4), (len(starts), 4))
+        end_colors = broadcast_to(asarray(end_colors, dtype=float64).reshape(-1, 4), (len(starts), 4))
+
+        # clipping, colors of clipped end points follow their place on the original lines
+        width, height = self._color_buffer.shape
+        starts, ends, accept, t0, t1 = RenderContext._clip_lines(starts, ends, (0, 0), (width - 1, height - 1))
+        t0, t1 = t0[accept, None], t1[accept, None]
+        start_colors, end_colors = start_colors[accept], end_colors[accept]
+        start_colors, end_colors = (start_colors * (1 - t0) + end_colors * t0,
+                                    start_colors * (1 - t1) + end_colors * t1)
+
+        xs, ys, ts, line_ids = rs.line_rasterize(floor(starts[accept]), floor(ends[accept]))
+        self._set_line_pixels(xs, ys, ts, start_colors[line_ids], end_colors[line_ids])
+
+    @staticmethod
+    def _clip_lines(starts, ends, min_pos, max_pos):
+        """Clip a batch of (line_count x 2) lines to the rectangle from min_pos to max_pos, both included
+
+        Out codes of all end points are computed at once, lines inside are accepted and lines beyond one
+        border rejected as they are, only lines crossing a border are clipped, with Liang-Barsky.
+        Return clipped starts and ends, the accept mask, and where clipped starts and ends lie along the
+        original lines, from 0 at start to 1 at end
+        """
+        min_pos, max_pos = asarray(min_pos, dtype=float64), asarray(max_pos, dtype=float64)
+
+        def encode(points):
+            return (points[:, 0] < min_pos[0]) * RenderContext.E_LEFT \
+                | (points[:, 0] > max_pos[0]) * RenderContext.E_RIGHT \
+                | (points[:, 1] < min_pos[1]) * RenderContext.E_BOTTOM \
+                | (points[:, 1] > max_pos[1]) * RenderContext.E_TOP
+
+        code1, code2 = encode(starts), encode(ends)
+        accept = (code1 | code2) == RenderContext.E_IN
+        crossing = ~accept & ((code1 & code2) == 0)
+
+        t0 = zeros(len(starts))
+        t1 = ones(len(starts))
+        starts, ends = array(starts, dtype=float64), array(ends, dtype=float64)
+        if crossing.any():
+            origins = starts[crossing]
+            directions = ends[crossing] - origins
+
+            # p * t <= q for the left, bottom, right and top borders
+            p = concatenate((-directions, directions), axis=1)
+            q = concatenate((origins - min_pos, max_pos - origins), axis=1)
+            with errstate(divide='ignore', invalid='ignore'):
+                r = q / p
+
+            # entering borders raise t0, leaving borders lower t1, parallel lines outside a border are rejected
+            lower = where(p < 0, r, 0).max(axis=1)
+            upper = where(p > 0, r, 1).min(axis=1)
+            accept[crossing] = (lower <= upper) & ~((p == 0) & (q < 0)).any(axis=1)
+
+            t0[crossing] = lower
+            t1[crossing] = upper
+            starts[crossing] = origins + directions * lower[:, None]
+            ends[crossing] = origins + directions * upper[:, None]
+
+        return starts, ends, accept, t0, t1
 
     def _draw_triangle(self, triangle):
+        """Fill a 2d triangle span by span
+
+        Span extents, clipped to the color buffer, and colors of all pixels are computed at once by the scan
+        line rasterizer, then every span is written with one slice assignment
+        """
         if not isinstance(triangle, pr.Triangle2d):
             raise TypeError
 
-        (v1, c1), (v2, c2), (v3, c3) = triangle.get_sorted_vector_by_y()
-        v1.rasterization()
-        v2.rasterization()
-        v3.rasterization()
+        vertices = array([[[int(v.x), int(v.y), 0, 1, c.r, c.g, c.b, c.a]
+                           for v, c in triangle.get_sorted_vector_by_y()]], dtype=float64)
+        width, height = self._color_buffer.shape
+        xs, ys, properties, _ = rs.scan_line_rasterize(pr.TriangleBatch.from_vertices(vertices),
+                                                      (0, 0, width, height))
+        if len(xs) == 0:
+            return
+
+        colors = cu.pack_rgba(*properties[4:8])
+
+        # pixels come row by row, each row is one span
+        starts = concatenate(([0], flatnonzero(ys[1:] != ys[:-1]) + 1))
+        ends = append(starts[1:], len(xs))
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            self._color_buffer[xs[start]: xs[end - 1] + 1, ys[start]] = colors[start: end]
 
-        if v2.y == v3.y:
-            self._fill_top_flat_triangle(pr.Triangle2d(v1, v2, v3, c1, c2, c3))
-        elif v2.y == v1.y:
-            self._fill_bottom_flat_triangle(
-                pr.Triangle2d(v3, v1, v2, c3, c1, c2))
+    def _vertex_input(self, instance_count=None):
+        """Vertices and indices of the bound vertex array
+
+        The array buffer is viewed as a (vertex_count x stride) array. With instance_count, all instances
+        are expanded into one vertex array.
+        Return the vertices, their index buffer and the array buffer they were read from
+        """
+        array_buffer = self._buffers[self._bound_buffer_id(RenderContext.BufferType.ARRAY_BUFFER)]
+        index_buffer = self._buffers[self._bound_buffer_id(RenderContext.BufferType.ELEMENT_ARRAY_BUFFER)]
+        if len(index_buffer) % 3 != 0:
+            raise IndexBufferCountError
+
+        layout = self._vertex_array_layout.get(self._current_bind_vertex_array_id, self._array_buffer_layout)
+        if isinstance(layout, VertexLayout):
+            self._each_vertex_properties_count = layout.properties_count
+            vertices = layout.decode(array_buffer)
         else:
-            v4 = Vector2(int(v1.x + (v2.y - v1.y) *
-                             (v3.x - v1.x) / (v3.y - v1.y)), v2.y)
-            v4.rasterization()
-            b1, b2, b3 = pr.Triangle2d(
-                v1, v2, v3, c1, c2, c3).get_barycentrix(v4)
-            c4 = c1 * b1 + c2 * b2 + c3 * b3
-
-            self._fill_top_flat_triangle(pr.Triangle2d(v1, v2, v4, c1, c2, c4))
-            self._fill_bottom_flat_triangle(
-                pr.Triangle2d(v3, v2, v4, c3, c2, c4))
-
-    def _geometry_stage(self):
+            self._each_vertex_properties_count = int(sum(layout))
+            vertices = asarray(array_buffer, dtype=float64).reshape(-1, self._each_vertex_properties_count)
+
+        if instance_count is not None:
+            vertices, index_buffer = self._instancing(vertices, index_buffer, instance_count)
+
+        return vertices, index_buffer, array_buffer
+
+    def _geometry_stage(self, vertices, index_buffer, array_buffer=None):
         """Geometry stage for rendering pipeline
-        """
-        ret = []
 
-        array_buffer = self._buffers[RenderContext.BufferType.ARRAY_BUFFER]
+        Every step below works on the whole (vertex_count x properties_count) vertices array at once.
+        Return screen space vertices and a (triangle_count x 3) array of their indices
+        """
+        self._vertex_count = vertices.shape[0]
 
         # vertex shading
-        self._each_vertex_properties_count = sum(self._array_buffer_layout)
-        self._vertex_count = int(len(array_buffer) / self._each_vertex_properties_count)
-
-        for i in range(self._vertex_count):
-            start_pos = i * self._each_vertex_properties_count
-            ret += self._vertex_shader.main(array_buffer[start_pos: start_pos + self._each_vertex_properties_count])
+        ret = asarray(self._vertex_shader.main_batch(vertices), dtype=float64)
+        if isinstance(array_buffer, ndarray) and may_share_memory(ret, array_buffer):
+            # screen mapping works in place, never write back into the bound buffer
+            ret = array(ret)
 
         # clipping
-        ...
+        ret, triangle_indices = self._clipping(ret, index_buffer.reshape(-1, 3))
 
         # screen mapping
-        half_width = RenderContext._Width * 0.5
-        half_height = RenderContext._Height * 0.5
-        self._each_vertex_properties_count = int(len(ret) / self._vertex_count)
-        for i in range(self._vertex_count):
-            start_pos = i * self._each_vertex_properties_count
-            inv_ndc_w = 1.0 / ret[start_pos + 3]
-            ret[start_pos] = (ret[start_pos] * inv_ndc_w + 1) * half_width
-            ret[start_pos + 1] = (ret[start_pos + 1] * inv_ndc_w + 1) * half_height
-            ret[start_pos + 2] = (ret[start_pos + 2] * inv_ndc_w)
-
-        return ret
-
-    def _rasterizer_stage(self, array_buffer):
+        self._each_vertex_properties_count = ret.shape[1]
+        inv_w = 1.0 / ret[:, 3]
+        ret[:, 0] = (ret[:, 0] * inv_w + 1) * (RenderContext._Width * 0.5)
+        ret[:, 1] = (ret[:, 1] * inv_w + 1) * (RenderContext._Height * 0.5)
+        ret[:, 2] = (ret[:, 2] * inv_w + 1) * 0.5
+
+        # perspective correct interpolation, rasterizers interpolate 1 / w and the attributes divided by w
+        # linearly in screen space, shade_pixels divides them back
+        ret[:, 3] = inv_w
+        ret[:, 4:] *= inv_w[:, None]
+
+        return ret, triangle_indices
+
+    def _instancing(self, vertices, index_buffer, instance_count):
+        """Expand vertices and indices for every instance, model matrices and tints applied in one pass
+
+        Return the (instance_count * vertex_count x properties_count) vertices and their index buffer
+        """
+        instance_buffer = self._buffers[self._bound_buffer_id(RenderContext.BufferType.INSTANCE_ARRAY_BUFFER)]
+        instances = asarray(instance_buffer, dtype=float64).reshape(-1, RenderContext._INSTANCE_STRIDE)
+        if instances.shape[0] < instance_count:
+            raise AttributeError('instance buffer holds %d instances, %d drawn' % (instances.shape[0], instance_count))
+        instances = instances[:instance_count]
+
+        vertex_count = vertices.shape[0]
+        ret = empty((instance_count, vertex_count, vertices.shape[1]), dtype=float64)
+        ret[:] = vertices
+
+        models = instances[:, :16].reshape(-1, 4, 4)
+        ret[:, :, :4] = einsum('nij,vj->nvi', models, vertices[:, :4])
+        tinted = ret[:, :, 4: 8]
+        tinted *= instances[:, None, 16: 16 + tinted.shape[2]]
+
+        indices = index_buffer.astype(int64)[None, :] + (arange(instance_count, dtype=int64) * vertex_count)[:, None]
+
+        return ret.reshape(-1, vertices.shape[1]), indices.ravel()
+
+    def _clipping(self, vertices, triangle_indices):
+        """Clip triangles against the view frustum in homogeneous clip space
+
+        Triangles completely outside one plane are rejected and triangles completely inside are kept
+        in bulk, only triangles crossing a plane are clipped one by one. New vertices are appended
+        after the original ones, triangles keep their draw order
+        """
+        distances = RenderContext._clip_plane_distances(vertices)
+        out_codes = ((distances < 0) * RenderContext._CLIP_PLANE_BITS).sum(axis=1)
+
+        triangle_codes = out_codes[triangle_indices]
+        codes_and = triangle_codes[:, 0] & triangle_codes[:, 1] & triangle_codes[:, 2]
+        codes_or = triangle_codes[:, 0] | triangle_codes[:, 1] | triangle_codes[:, 2]
+
+        inside = flatnonzero(codes_or == 0)
+        crossing = flatnonzero((codes_and == 0) & (codes_or != 0))
+        if len(crossing) == 0:
+            return vertices, triangle_indices[inside]
+
+        new_vertices = []
+        new_triangles = []
+        new_sources = []
+        next_index = vertices.shape[0]
+        for source in crossing.tolist():
+            triangle = triangle_indices[source]
+            polygon = RenderContext._clip_polygon([(index, vertices[index], distances[index]) for index in triangle])
+            if len(polygon) < 3:
+                continue
+
+            polygon_indices = []
+            for index, vertex, _ in polygon:
+                if index is None:
+                    new_vertices.append(vertex)
+                    index = next_index
+                    next_index += 1
+                polygon_indices.append(index)
+
+            # triangle fan
+            for i in range(1, len(polygon_indices) - 1):
+                new_triangles.append((polygon_indices[0], polygon_indices[i], polygon_indices[i + 1]))
+                new_sources.append(source)
+
+        if len(new_vertices) > 0:
+            vertices = concatenate((vertices, array(new_vertices)))
+        if len(new_triangles) == 0:
+            return vertices, triangle_indices[inside]
+
+        # fan triangles take the place of the triangle they come from, a stable sort keeps fans in order
+        triangles = concatenate((triangle_indices[inside], array(new_triangles, dtype=triangle_indices.dtype)))
+        sources = concatenate((inside, array(new_sources, dtype=inside.dtype)))
+
+        return vertices, triangles[argsort(sources, kind='mergesort')]
+
+    @staticmethod
+    def _clip_plane_distances(vertices):
+        """Signed distances to the clip planes, a vertex is inside a plane when its distance is not negative
+        """
+        x, y, z, w = vertices[:, 0], vertices[:, 1], vertices[:, 2], vertices[:, 3]
+        return stack((w + x, w - x, w + y, w - y, w + z, w - z, w - RenderContext._CLIP_MIN_W), axis=-1)
+
+    @staticmethod
+    def _clip_polygon(polygon):
+        """Sutherland-Hodgman clipping of a polygon given as (index, vertex, plane distances) triples
+
+        Vertices created by clipping have index None. Distances are linear in the vertex, so those of new
+        vertices are interpolated like the vertices themselves
+        """
+        for plane in range(len(RenderContext._CLIP_PLANE_BITS)):
+            if len(polygon) == 0:
+                break
+
+            clipped = []
+            for i in range(len(polygon)):
+                j = (i + 1) % len(polygon)
+                d1, d2 = polygon[i][2][plane], polygon[j][2][plane]
+                if d1 >= 0:
+                    clipped.append(polygon[i])
+                if (d1 >= 0) != (d2 >= 0):
+                    t = d1 / (d1 - d2)
+                    clipped.append((None,
+                                    polygon[i][1] + (polygon[j][1] - polygon[i][1]) * t,
+                                    polygon[i][2] + (polygon[j][2] - polygon[i][2]) * t))
+            polygon = clipped
+
+        return polygon
+
+    def _rasterizer_stage(self, array_buffer, triangle_indices):
         """Rasterizer stage
         """
-        # triangle setup
+        # triangle setup, one gather gives the (triangle_count x 3 x properties_count) vertices of all triangles
         profiler.Profiler.begin('pixel_stage.triangle_setup')
-        index_buffer = self._buffers[RenderContext.BufferType.ELEMENT_ARRAY_BUFFER]
-        if len(index_buffer) % 3 != 0:
-            raise IndexBufferCountError
-
-        triangles = []
-        for i1, i2, i3 in zip(*[iter(index_buffer)] * 3):
-            start_1 = i1 * self._each_vertex_properties_count
-            start_2 = i2 * self._each_vertex_properties_count
-            start_3 = i3 * self._each_vertex_properties_count
-            triangles.append(pr.Triangle(pr.Point(start_1, array_buffer),
-                                         pr.Point(start_2, array_buffer),
-                                         pr.Point(start_3, array_buffer)))
+        vertices = array_buffer[triangle_indices]
+        vertices = vertices[self._culling(vertices)]
+        if self._rasterizer == RenderContext.RasterizerType.SCAN_LINE:
+            vertices[:, :, :2] = floor(vertices[:, :, :2])
+        triangles = pr.TriangleBatch.from_vertices(vertices)
         profiler.Profiler.end()
 
-        # triangle traversal
-        profiler.Profiler.begin('pixel_stage.triangle_traversal')
-        for triangle in triangles:
-            triangle.rasterize()
-        profiler.Profiler.end()
+        if self._rasterizer == RenderContext.RasterizerType.TILED:
+            self._tiled_rasterizer_stage(triangles)
+            return
 
-        # pixel shading
+        # triangle traversal and pixel shading run on the worker pool, batches are merged in order
+        # as soon as they are shaded, so early-z of later batches sees the depth of earlier ones
         profiler.Profiler.begin('pixel_stage.pixel_shading')
-        for triangle in triangles:
-            triangle.pixel_shading(self._pixel_shader)
+        pixel_shader = self._pixel_shader
+        pixel_filter = self._early_pixel_filter
+        width, height = self._color_buffer.shape
+
+        def scan_line_job(triangle_batch):
+            xs, ys, properties, triangle_ids = rs.scan_line_rasterize(triangle_batch, (0, 0, width, height))
+            return rs.shade_pixels(xs, ys, properties, pixel_shader, pixel_filter, triangle_ids)
+
+        def edge_function_job(triangle_batch):
+            # triangles are traversed one by one and their pixels shaded at once
+            setup = triangle_batch.setup
+            pixels = [rs.edge_function_rasterize(vertices, (0, 0, width, height), edges, one_over_area)
+                      for vertices, edges, one_over_area in zip(triangle_batch.vertices, setup.edges,
+                                                                setup.one_over_areas)]
+            xs, ys, properties = (concatenate(columns, axis=-1) for columns in zip(*pixels))
+            triangle_ids = repeat(arange(len(pixels)), [len(triangle_xs) for triangle_xs, _, _ in pixels])
+            return rs.shade_pixels(xs, ys, properties, pixel_shader, pixel_filter, triangle_ids)
+
+        shading_job = scan_line_job if self._rasterizer == RenderContext.RasterizerType.SCAN_LINE \
+            else edge_function_job
+
+        for pixels_batch in self._worker_pool.imap(shading_job, self._worker_pool.split(triangles, 16)):
+            # merging
+            for pixels in pixels_batch:
+                self._merging(*pixels)
         profiler.Profiler.end()
 
-        # merging
-        profiler.Profiler.begin('pixel_stage.merging')
-        for triangle in triangles:
-            ru.merging(triangle.pixels, self._color_buffer)
+    def _tiled_rasterizer_stage(self, triangles):
+        """Rasterizer stage of the tiled rasterizer
+
+        Triangles are binned into screen tiles, then every tile rasterizes, shades and merges its own
+        triangles into a tile local color and depth block. Tiles never overlap, so they run on the worker
+        pool with no ordering between them and write their blocks back directly
+        """
+        # binning
+        profiler.Profiler.begin('pixel_stage.binning')
+        width, height = self._color_buffer.shape
+        tiles = rs.bin_triangles(triangles.positions[:, :, :2], self._tile_size, width, height)
+        vertices = triangles.vertices
+        edges, one_over_areas = triangles.setup.edges, triangles.setup.one_over_areas
         profiler.Profiler.end()
 
-    def _clear_color_buffer(self):
-        self._color_buffer.fill(0)
+        # rasterization, pixel shading and merging of each tile
+        profiler.Profiler.begin('pixel_stage.tiles')
+        pixel_shader = self._pixel_shader
 
-    def _set_pixels(self, new_pixels):
-        self._color_buffer = new_pixels
+        def tile_job(tile):
+            rect, triangle_ids = tile
+            min_x, min_y, max_x, max_y = rect
+            color_block = self._color_buffer[min_x: max_x, min_y: max_y].copy()
+            depth_block = self._depth_buffer[min_x: max_x, min_y: max_y].copy()
 
-    def _set_pixel(self, x, y, color):
-        if x > RenderContext._Width or x < 0 or y > RenderContext._Height or y < 0:
-            return
+            def tile_pixel_filter(xs, ys, zs):
+                return self._early_depth_mask(zs, depth_block[xs - min_x, ys - min_y])
 
-        self._color_buffer[x, y] = color.hex()
+            for triangle_id in triangle_ids:
+                pixels = rs.edge_function_rasterize(vertices[triangle_id], rect,
+                                                    edges[triangle_id], one_over_areas[triangle_id])
+                xs, ys, zs, colors = rs.shade_pixels(*pixels, pixel_shader, tile_pixel_filter)
+                self._merge_pixels(color_block, depth_block, xs - min_x, ys - min_y, zs, colors)
 
-    def _cohen_sutherland_line_clip(self, line, min_pos, max_pos):
-        def encode(pos, _min_pos, _max_pos):
-            _code = self.E_IN
+            self._color_buffer[min_x: max_x, min_y: max_y] = color_block
+            self._depth_buffer[min_x: max_x, min_y: max_y] = depth_block
 
-            if pos.x < _min_pos.x:
-                _code |= self.E_LEFT
-            elif pos.x > _max_pos.x:
-                _code |= self.E_RIGHT
+        self._worker_pool.map(tile_job, tiles)
+        profiler.Profiler.end()
 
-            if pos.y < _min_pos.y:
-                _code |= self.E_BOTTOM
-            elif pos.y > _max_pos.y:
-                _code |= self.E_TOP
+    def _culling(self, vertices):
+        """Mask of triangles kept after dropping back or front facing, zero area and sub-pixel triangles,
+        computed for all triangles at once
+        """
+        p1, p2, p3 = vertices[:, 0, :2], vertices[:, 1, :2], vertices[:, 2, :2]
+
+        # twice the signed area, positive for counter-clockwise triangles
+        e1, e2 = p2 - p1, p3 - p1
+        area = e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0]
+
+        # no pixel center inside the bounding box
+        bbox_min = minimum(minimum(p1, p2), p3)
+        bbox_max = maximum(maximum(p1, p2), p3)
+        keep = (ceil(bbox_min - 0.5) <= floor(bbox_max - 0.5)).all(axis=1)
+
+        # zero area, for the scan line rasterizer once snapped to the pixel grid
+        if self._rasterizer == RenderContext.RasterizerType.SCAN_LINE:
+            s1, s2, s3 = floor(p1), floor(p2), floor(p3)
+            e1, e2 = s2 - s1, s3 - s1
+            keep &= e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0] != 0
+        else:
+            keep &= area != 0
 
-            return _code
+        if self._cull_face != RenderContext.CullFace.NONE:
+            front = area > 0 if self._front_face == RenderContext.FrontFace.CCW else area < 0
+            keep &= ~front if self._cull_face == RenderContext.CullFace.FRONT else front
 
-        (x1, y1) = (line.start.x, line.start.y)
-        (x2, y2) = (line.end.x, line.end.y)
+        return keep
 
-        code1 = encode(Vector2(x1, y1), min_pos, max_pos)
-        code2 = encode(Vector2(x2, y2), min_pos, max_pos)
+    def _early_pixel_filter(self, xs, ys, zs):
+        """Drop pixels outside the frame buffer and, when early-z is on, pixels already hidden
+        """
+        width, height = self._color_buffer.shape
+        mask = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        mask[mask] = self._early_depth_mask(zs[mask], self._depth_buffer[xs[mask], ys[mask]])
+        if self._early_z_enabled():
+            mask[mask] = self._visible_pixel_mask(xs[mask], ys[mask], zs[mask], height)
 
-        accept = False
+        return mask
 
-        while True:
-            if code1 | code2 == 0:
-                accept = True
-                break
+    def _visible_pixel_mask(self, xs, ys, zs, height):
+        """Keep one pixel per position of a batch of pixels in draw order, the one the depth test
+        would merge last, so pixels hidden by later triangles of the batch are not shaded either
+        """
+        if len(xs) == 0:
+            return ones(0, dtype=bool)
 
-            elif code1 & code2 != 0:
-                break
+        # nearest passing depth first, on ties the first pixel for strict tests and the last one otherwise
+        keys = xs.astype(int64) * height + ys
+        order = arange(len(xs))
+        strict = self._depth_func in (RenderContext.DepthFunc.LESS, RenderContext.DepthFunc.GREATER)
+        greater = self._depth_func in (RenderContext.DepthFunc.GREATER, RenderContext.DepthFunc.GEQUAL)
+        ranked = lexsort((order if strict else -order, -zs if greater else zs, keys))
 
-            else:
-                code = code1 if code1 != 0 else code2
-                (x, y) = (0, 0)
-                if code & self.E_TOP != 0:
-                    x = x1 + (x2 - x1) * (max_pos.y - y1) / (y2 - y1)
-                    y = max_pos.y
-                elif code & self.E_BOTTOM != 0:
-                    x = x1 + (x2 - x1) * (min_pos.y - y1) / (y2 - y1)
-                    y = min_pos.y
-                elif code & self.E_LEFT != 0:
-                    x = min_pos.x
-                    y = y1 + (y2 - y1) * (min_pos.x - x1) / (x2 - x1)
-                elif code & self.E_RIGHT != 0:
-                    x = max_pos.x
-                    y = y1 + (y2 - y1) * (max_pos.x - x1) / (x2 - x1)
-
-                if code == code1:
-                    (x1, y1) = (int(x), int(y))
-                    code1 = encode(Vector2(x1, y1), min_pos, max_pos)
-                else:
-                    (x2, y2) = (int(x), int(y))
-                    code2 = encode(Vector2(x2, y2), min_pos, max_pos)
-
-        if accept:
-            return True, pr.Line2d(x1, y1, x2, y2)
+        sorted_keys = keys[ranked]
+        first = concatenate(([True], sorted_keys[1:] != sorted_keys[:-1]))
+        mask = zeros(len(xs), dtype=bool)
+        mask[ranked[first]] = True
+
+        return mask
+
+    def _early_depth_mask(self, zs, depths):
+        """Early depth test of pixels against the depth they would be merged with
+
+        The depth buffer only ever gets closer while a frame is drawn, so a pixel failing a monotonic
+        depth test now would fail it at merging too
+        """
+        if self._early_z_enabled():
+            return self._depth_test_pass(zs, depths)
+
+        return ones(zs.shape, dtype=bool)
+
+    def _early_z_enabled(self):
+        return self._depth_test and self._early_z and self._depth_func in RenderContext._EARLY_Z_DEPTH_FUNC
+
+    def _depth_test_pass(self, zs, depths):
+        func = self._depth_func
+        if func == RenderContext.DepthFunc.LESS:
+            return zs < depths
+        elif func == RenderContext.DepthFunc.LEQUAL:
+            return zs <= depths
+        elif func == RenderContext.DepthFunc.GREATER:
+            return zs > depths
+        elif func == RenderContext.DepthFunc.GEQUAL:
+            return zs >= depths
+        elif func == RenderContext.DepthFunc.EQUAL:
+            return zs == depths
+        elif func == RenderContext.DepthFunc.NOTEQUAL:
+            return zs != depths
+        elif func == RenderContext.DepthFunc.NEVER:
+            return zeros(zs.shape, dtype=bool)
         else:
-            return False, None
+            return ones(zs.shape, dtype=bool)
 
-    def _fill_bottom_flat_triangle(self, triangle):
-        if not isinstance(triangle, pr.Triangle2d):
-            raise TypeError
+    def _merging(self, xs, ys, zs, colors):
+        self._merge_pixels(self._color_buffer, self._depth_buffer, xs, ys, zs, colors)
 
-        inv_slope1 = (triangle.v2.x - triangle.v1.x) / \
-                     (triangle.v2.y - triangle.v1.y)
-        inv_slope2 = (triangle.v3.x - triangle.v1.x) / \
-                     (triangle.v3.y - triangle.v1.y)
-        if inv_slope1 < inv_slope2:
-            inv_slope1, inv_slope2 = inv_slope2, inv_slope1
-            triangle.c2, triangle.c3 = triangle.c3, triangle.c2
-
-        cx1, cx2 = triangle.v1.x, triangle.v1.x
-        rate_span = 1 / (triangle.v1.y - triangle.v3.y)
-        t = 0
-
-        for y in range(triangle.v1.y, triangle.v2.y - 1, -1):
-            # x1, x2 = int(cx1), int(cx2)
-            # c1, c2 = triangle.get_pixel_color(Vector2(x1, y)),
-            # triangle.get_pixel_color(Vector2(x2, y))
-            temp_c = triangle.c1 * (1 - t)
-            c1, c2 = temp_c + triangle.c2 * t, temp_c + triangle.c3 * t
-            self._draw_line(pr.Line2d(int(cx1), y, int(cx2), y), c1, c2)
-            cx1 -= inv_slope1
-            cx2 -= inv_slope2
-            t += rate_span
-
-    def _fill_top_flat_triangle(self, triangle):
-        if not isinstance(triangle, pr.Triangle2d):
-            raise TypeError
+    def _merge_pixels(self, color_buffer, depth_buffer, xs, ys, zs, colors):
+        if self._depth_test:
+            mask = self._depth_test_pass(zs, depth_buffer[xs, ys])
+            xs, ys, zs, colors = xs[mask], ys[mask], zs[mask], colors[mask]
+            depth_buffer[xs, ys] = zs
+
+        color_buffer[xs, ys] = colors
+
+    def _clear_color_buffer(self):
+        self._color_buffer.fill(0)
+
+    def _clear_depth_buffer(self):
+        self._depth_buffer.fill(self._clear_depth)
+
+    def _set_pixels(self, new_pixels):
+        self._color_buffer = new_pixels
+
+    def _set_pixel(self, x, y, color):
+        width, height = self._color_buffer.shape
+        if x >= width or x < 0 or y >= height or y < 0:
+            return
+
+        self._color_buffer[x, y] = color.hex()
+
+    def _set_line_pixels(self, xs, ys, ts, colors1, colors2):
+        """Write pixels of lines in one scatter, colors are interpolated between the (pixel_count x 4)
+        colors1 and colors2 by ts, pixels outside the color buffer or with invalid colors are dropped
+        """
+        ts = ts[:, None]
+        channels = colors1 * (1 - ts) + colors2 * ts
+
+        width, height = self._color_buffer.shape
+        mask = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height) & (channels >= 0).all(axis=1)
 
-        inv_slope1 = (triangle.v2.x - triangle.v1.x) / \
-                     (triangle.v2.y - triangle.v1.y)
-        inv_slope2 = (triangle.v3.x - triangle.v1.x) / \
-                     (triangle.v3.y - triangle.v1.y)
-        if inv_slope1 > inv_slope2:
-            inv_slope1, inv_slope2 = inv_slope2, inv_slope1
-            triangle.c2, triangle.c3 = triangle.c3, triangle.c2
-
-        cx1, cx2 = triangle.v1.x, triangle.v1.x
-        rate_span = 1 / (triangle.v3.y - triangle.v1.y)
-        t = 0
-
-        for y in range(triangle.v1.y, triangle.v2.y + 1):
-            # x1, x2 = int(cx1), int(cx2)
-            # c1, c2 = triangle.get_pixel_color(Vector2(x1, y)),
-            # triangle.get_pixel_color(Vector2(x2, y))
-            temp_c = triangle.c1 * (1 - t)
-            c1, c2 = temp_c + triangle.c2 * t, temp_c + triangle.c3 * t
-            self._draw_line(pr.Line2d(int(cx1), y, int(cx2), y), c1, c2)
-            cx1 += inv_slope1
-            cx2 += inv_slope2
-            t += rate_span
+        self._color_buffer[xs[mask], ys[mask]] = cu.pack_rgba(*channels[mask].T)
@@ -1,6 +1,8 @@
 # -*- coding:utf-8 -*-
 
 
+from numpy import empty, float64, array
+
 from softrenderer.common.types import Color
 
 
@@ -11,11 +13,41 @@ class Shader:
 
 
 class VertexShader(Shader):
-    pass
+
+    def main_batch(self, vertices):
+        """Shade every vertex of a draw call at once
+
+        vertices is a (vertex_count x stride) array, a (vertex_count x new_stride) array should be returned.
+        The default implementation calls main once per vertex, override it to shade in bulk.
+        """
+        vertex_count = vertices.shape[0]
+        if vertex_count == 0:
+            return empty(vertices.shape, dtype=float64)
+
+        first = self.main(vertices[0].tolist())
+        ret = empty((vertex_count, len(first)), dtype=float64)
+        ret[0] = first
+        for i in range(1, vertex_count):
+            ret[i] = self.main(vertices[i].tolist())
+
+        return ret
 
 
 class PixelShader(Shader):
-    pass
+
+    def main_batch(self, pixel_properties):
+        """Shade a batch of pixels at once
+
+        pixel_properties is a (properties_count x pixel_count) array, each row is one property column
+        (x, y, then the interpolated vertex properties). Either packed RGBA8888 uint32 values or a
+        (4 x pixel_count) float RGBA array should be returned.
+        The default implementation calls main once per pixel, override it to shade in bulk.
+        """
+        colors = [self.main(properties) for properties in pixel_properties.T.tolist()]
+        return array([[c.r for c in colors],
+                      [c.g for c in colors],
+                      [c.b for c in colors],
+                      [c.a for c in colors]], dtype=float64).reshape(4, -1)
 
 
 class _DefaultVertexShader(VertexShader):
@@ -23,8 +55,14 @@ class _DefaultVertexShader(VertexShader):
     def main(self, vertex_properties):
         return vertex_properties
 
+    def main_batch(self, vertices):
+        return vertices
+
 
 class _DefaultPixelShader(PixelShader):
 
     def main(self, pixel_properties):
         return Color(pixel_properties[2], pixel_properties[3], pixel_properties[4], pixel_properties[5])
+
+    def main_batch(self, pixel_properties):
+        return pixel_properties[2:6]
@@ -2,7 +2,6 @@
 
 
 from softrenderer.render.renderer import Renderer
-from softrenderer.render import render_context as rc
 from softrenderer.render.vertex_array import VertexArray
 
 
@@ -33,25 +32,22 @@ class TriangleRenderer(Renderer):
 
     def set_tf(self, tf):
         self._tf = tf
-        world_mat = tf.get_local_to_world_matrix()
-        self._nv1, self._nv2, self._nv3 = (world_mat * self._v1,
-                                           world_mat * self._v2,
-                                           world_mat * self._v3)
+        self._update_positions()
 
     def draw(self, render_context):
-        if self._tf.is_dirty:
-            world_mat = self._tf.get_local_to_world_matrix()
-            self._nv1, self._nv2, self._nv3 = (world_mat * self._v1,
-                                               world_mat * self._v2,
-                                               world_mat * self._v3)
-        self._vertex_buffer = [
-            self._nv1.x, self._nv1.y, self._nv1.z, self._nv1.w, self._c1.r, self._c1.g, self._c1.b, self._c1.a,
-            self._nv2.x, self._nv2.y, self._nv2.z, self._nv2.w, self._c2.r, self._c2.g, self._c2.b, self._c2.a,
-            self._nv3.x, self._nv3.y, self._nv3.z, self._nv3.w, self._c3.r, self._c3.g, self._c3.b, self._c3.a,
-        ]
-
-        rc.RenderContext.buffer_data(rc.RenderContext.BufferType.ARRAY_BUFFER, self._vertex_buffer)
+        if self._tf is not None and self._tf.is_dirty:
+            self._update_positions()
 
         self._vertex_array.bind()
         render_context.draw()
         self._vertex_array.un_bind()
+
+    def _update_positions(self):
+        world_mat = self._tf.get_local_to_world_matrix()
+        self._nv1, self._nv2, self._nv3 = (world_mat * self._v1,
+                                           world_mat * self._v2,
+                                           world_mat * self._v3)
+
+        # only positions move, colors stay as uploaded
+        for index, vertex in enumerate((self._nv1, self._nv2, self._nv3)):
+            self._vertex_array.update_vertex_buffer(index * 8, [vertex.x, vertex.y, vertex.z, vertex.w])
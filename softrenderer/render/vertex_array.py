@@ -1,17 +1,24 @@
 # -*- coding:utf-8 -*-
 
 
+from numpy import ndarray
+
 from softrenderer.render import render_context as rc
+from softrenderer.render.vertex_layout import VertexLayout
 
 
 class VertexArray:
     """Array for all vertex data
+
+    instance_buffer optionally holds per instance attributes for RenderContext.draw_instanced
     """
 
-    def __init__(self, vertex_buffer, layout_buffer, index_buffer):
+    def __init__(self, vertex_buffer, layout_buffer, index_buffer, instance_buffer=None):
         self._vertex_buffer = vertex_buffer
         self._layout_buffer = layout_buffer
         self._index_buffer = index_buffer
+        self._instance_buffer = instance_buffer
+        self._instance_buffer_id = None
 
         self._renderer_id = rc.RenderContext.gen_vertex_array(1)
         self.bind()
@@ -21,6 +28,10 @@ class VertexArray:
         rc.RenderContext.bind_buffer(rc.RenderContext.BufferType.ELEMENT_ARRAY_BUFFER, self._index_buffer_id)
         rc.RenderContext.buffer_data(rc.RenderContext.BufferType.ELEMENT_ARRAY_BUFFER, index_buffer)
         rc.RenderContext.bind_array_buffer_layout(layout_buffer)
+        if instance_buffer is not None:
+            self._instance_buffer_id = rc.RenderContext.gen_buffers(1)
+            rc.RenderContext.bind_buffer(rc.RenderContext.BufferType.INSTANCE_ARRAY_BUFFER, self._instance_buffer_id)
+            rc.RenderContext.buffer_data(rc.RenderContext.BufferType.INSTANCE_ARRAY_BUFFER, instance_buffer)
 
         self.un_bind()
 
@@ -32,8 +43,36 @@ class VertexArray:
 
     def delete(self):
         rc.RenderContext.delete_buffers(self._vertex_buffer_id, self._index_buffer_id)
-        rc.RenderContext.delete_vertex_array(self._vertex_buffer_id)
-        rc.RenderContext.delete_array_buffer_layout()
+        if self._instance_buffer_id is not None:
+            rc.RenderContext.delete_buffers(self._instance_buffer_id)
+        rc.RenderContext.delete_vertex_array(self._renderer_id)
+
+    def update_vertex_buffer(self, offset, data):
+        """Overwrite part of the uploaded vertex buffer, see RenderContext.buffer_sub_data
+        """
+        self._buffer_sub_data(rc.RenderContext.BufferType.ARRAY_BUFFER, offset, data)
+
+    def update_instance_buffer(self, offset, data):
+        """Overwrite part of the uploaded instance buffer, see RenderContext.buffer_sub_data
+        """
+        if self._instance_buffer_id is None:
+            raise AttributeError('vertex array has no instance buffer')
+
+        self._buffer_sub_data(rc.RenderContext.BufferType.INSTANCE_ARRAY_BUFFER, offset, data)
+
+    def _buffer_sub_data(self, buffer_type, offset, data):
+        # the buffers are bound in this vertex array, bind it for the update and restore the bound one,
+        # binding buffers here would rebind them in whatever vertex array is bound
+        previous = rc.RenderContext.bound_vertex_array()
+        self.bind()
+        try:
+            rc.RenderContext.buffer_sub_data(buffer_type, offset, data)
+        finally:
+            rc.RenderContext.bind_vertex_array(previous)
+
+    @property
+    def renderer_id(self):
+        return self._renderer_id
 
     @property
     def vertex_buffer(self):
@@ -55,18 +94,22 @@ class VertexArray:
 
     @index_buffer.setter
     def index_buffer(self, index_buffer):
-        if not isinstance(index_buffer, list):
+        if not isinstance(index_buffer, (list, ndarray)):
             raise TypeError
 
         self._index_buffer = index_buffer
 
+    @property
+    def instance_buffer(self):
+        return self._instance_buffer
+
     @property
     def layout_buffer(self):
         return self._layout_buffer
 
     @layout_buffer.setter
     def layout_buffer(self, layout_buffer):
-        if not isinstance(layout_buffer, list):
+        if not isinstance(layout_buffer, (list, VertexLayout)):
             raise TypeError
 
         self._layout_buffer = layout_buffer
@@ -0,0 +1,119 @@
+# -*- coding:utf-8 -*-
+
+
+import numpy as np
+
+
+class VertexAttribute:
+    """One attribute of an interleaved vertex buffer
+
+    count components of dtype, offset bytes from the start of the vertex.
+    Integer attributes may be normalized, mapping their range to [0, 1] or [-1, 1]
+    """
+
+    def __init__(self, count, dtype=np.float32, offset=None, normalized=False):
+        if count <= 0:
+            raise AttributeError('count must be positive')
+
+        self._count = count
+        self._dtype = np.dtype(dtype)
+        self._offset = offset
+        self._normalized = normalized
+
+    def __str__(self):
+        return 'VertexAttribute(count: %d, dtype: %s, offset: %s, normalized: %s)' \
+               % (self._count, self._dtype, self._offset, self._normalized)
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def offset(self):
+        return self._offset
+
+    @property
+    def normalized(self):
+        return self._normalized
+
+    @property
+    def size(self):
+        return self._count * self._dtype.itemsize
+
+
+class VertexLayout:
+    """Layout of an interleaved vertex buffer
+
+    Attributes without offset are packed right after the previous one, stride defaults to the packed size.
+    Buffers described by a layout are read in place through strided views, any object supporting the buffer
+    protocol (numpy array, bytes, bytearray, memoryview, array.array) can be bound without copying
+    """
+
+    def __init__(self, attributes, stride=None):
+        self._attributes = []
+
+        offset = 0
+        for attribute in attributes:
+            if attribute.offset is None:
+                attribute = VertexAttribute(attribute.count, attribute.dtype, offset, attribute.normalized)
+            self._attributes.append(attribute)
+            offset = attribute.offset + attribute.size
+
+        self._vertex_size = max([attribute.offset + attribute.size for attribute in self._attributes] + [0])
+        self._stride = self._vertex_size if stride is None else stride
+        if self._stride < self._vertex_size:
+            raise AttributeError('stride %d smaller than vertex size %d' % (self._stride, self._vertex_size))
+
+    def __str__(self):
+        return 'VertexLayout(stride: %d, attributes: [%s])' \
+               % (self._stride, ', '.join(str(attribute) for attribute in self._attributes))
+
+    @property
+    def attributes(self):
+        return self._attributes
+
+    @property
+    def stride(self):
+        return self._stride
+
+    @property
+    def properties_count(self):
+        return sum(attribute.count for attribute in self._attributes)
+
+    def vertex_count(self, data):
+        nbytes = memoryview(data).nbytes
+        if nbytes < self._vertex_size:
+            return 0
+        return (nbytes - self._vertex_size) // self._stride + 1
+
+    def attribute_view(self, data, index):
+        """Zero-copy (vertex_count x count) view of one attribute
+        """
+        attribute = self._attributes[index]
+        raw = np.frombuffer(data, dtype=np.uint8)
+        return np.ndarray((self.vertex_count(data), attribute.count), dtype=attribute.dtype, buffer=raw,
+                          offset=attribute.offset, strides=(self._stride, attribute.dtype.itemsize))
+
+    def decode(self, data, out=None):
+        """Convert all attributes to a (vertex_count x properties_count) float64 array
+        """
+        if out is None:
+            out = np.empty((self.vertex_count(data), self.properties_count), dtype=np.float64)
+
+        column = 0
+        for index, attribute in enumerate(self._attributes):
+            values = out[:, column: column + attribute.count]
+            values[...] = self.attribute_view(data, index)
+
+            if attribute.normalized and attribute.dtype.kind in 'ui':
+                values /= np.iinfo(attribute.dtype).max
+                if attribute.dtype.kind == 'i':
+                    np.maximum(values, -1.0, out=values)
+
+            column += attribute.count
+
+        return out
@@ -0,0 +1,77 @@
+# -*- coding:utf-8 -*-
+
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+class WorkerPool:
+    """Long-lived pool of rendering workers
+
+    Workers are threads of this process, so shaders and buffers are shared with them instead of being
+    pickled for every job, and numpy releases the GIL while they crunch arrays.
+    The pool starts on first use and is kept alive until shutdown or a worker count change.
+    """
+    # items of one work unit at most
+    MAX_UNIT_SIZE = 256
+
+    def __init__(self, worker_count=None):
+        self._worker_count = 1
+        self._executor = None
+        self.worker_count = worker_count
+
+    @property
+    def worker_count(self):
+        return self._worker_count
+
+    @worker_count.setter
+    def worker_count(self, worker_count):
+        if worker_count is None:
+            worker_count = os.cpu_count() or 1
+
+        if worker_count <= 0:
+            raise AttributeError('worker count must be positive')
+
+        if worker_count != self._worker_count:
+            self.shutdown()
+            self._worker_count = worker_count
+
+    @property
+    def is_running(self):
+        return self._executor is not None
+
+    def start(self):
+        if self._executor is None and self._worker_count > 1:
+            self._executor = ThreadPoolExecutor(max_workers=self._worker_count)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def map(self, job, work_units):
+        """Run job for every work unit, results are returned in submission order
+        """
+        return list(self.imap(job, work_units))
+
+    def imap(self, job, work_units):
+        """Lazy version of map, results are yielded in submission order as soon as they are ready
+
+        With a single worker each work unit only runs when its result is requested
+        """
+        work_units = list(work_units)
+        if self._worker_count <= 1 or len(work_units) <= 1:
+            return (job(work_unit) for work_unit in work_units)
+
+        self.start()
+        return self._executor.map(job, work_units)
+
+    def split(self, items, min_unit_size=1):
+        """Split items into coarse work units, a few per worker and at most MAX_UNIT_SIZE items each
+
+        Units stay large enough to keep batches vectorized, also with a single worker, and bounded so
+        consumers of imap can interleave their own work
+        """
+        unit_count = max(1, min(self._worker_count * 2, len(items) // max(1, min_unit_size)))
+        unit_size = max(1, min(-(-len(items) // unit_count), WorkerPool.MAX_UNIT_SIZE))
+        return [items[i: i + unit_size] for i in range(0, len(items), unit_size)]
@@ -1,11 +1,32 @@
 # -*- coding:utf-8 -*-
 
 
+import io
+import os
+import struct
+import subprocess
+import sys
 import unittest
+import zlib
+
+from numpy import array, float32, uint8, zeros
+
 from softrenderer.common.math.matrix import Matrix2x2, Matrix3x3
 from softrenderer.common.math.vector import Vector2, Vector3, Vector4
+from softrenderer.common.primitive import Line2d, Triangle2d, TriangleBatch
 from softrenderer.common.math.quaternion import Quaternion
 from softrenderer.common.transform import Transform
+from softrenderer.common import image, utils
+from softrenderer.common.frame_stream import FrameStream
+from softrenderer.common.types import Color
+from softrenderer.debug.profiler import Profiler
+from softrenderer.render import rasterizer
+from softrenderer.render.command_buffer import CommandBuffer
+from softrenderer.render.render_context import RenderContext
+from softrenderer.render.vertex_array import VertexArray
+from softrenderer.render.vertex_layout import VertexAttribute, VertexLayout
+from softrenderer.render.shader import VertexShader, PixelShader, _DefaultPixelShader
+from softrenderer.render.worker_pool import WorkerPool
 
 
 class TestMatrix2x2Methods(unittest.TestCase):
@@ -170,5 +191,640 @@ class TestTransformMethods(unittest.TestCase):
         print(tmp.get_local_to_world_matrix() * Vector4(Vector3.right(), 1))
 
 
+class TestUtilsMethods(unittest.TestCase):
+
+    def test_rgb2hex(self):
+        self.assertEqual(utils.rgb2hex(255, 0, 128, 1), 0xff008001)
+
+    def test_pack_rgba(self):
+        self.assertEqual(utils.pack_rgba(1, 0, 0.5, 1), 0xff007fff)
+        self.assertEqual(utils.pack_rgba(2, -1, 0, 1), 0xff0000ff)
+        self.assertEqual(Color(0, 1, 0, 1).hex(), 0x00ff00ff)
+
+        ret = utils.pack_rgba(array([1, 0.5]), array([0, 2]), array([-1, 0]), array([1, 1]))
+        self.assertEqual(ret.dtype, 'uint32')
+        self.assertEqual(ret.tolist(), [0xff0000ff, 0x7fff00ff])
+
+
+class TestImageMethods(unittest.TestCase):
+
+    def setUp(self):
+        # [x, y] indexed, y up
+        self.color_buffer = array([[0xff0000ff, 0x00ff00ff], [0x0000ffff, 0x01020304]], dtype='uint32')
+
+    def test_rgba_rows(self):
+        rows = image.rgba_rows(self.color_buffer)
+        self.assertEqual(rows.shape, (2, 2, 4))
+        self.assertEqual(rows[0, 0].tolist(), [0, 255, 0, 255])
+        self.assertEqual(rows[1, 1].tolist(), [0, 0, 255, 255])
+        self.assertEqual(image.rgba_rows(self.color_buffer[:1])[0, 0].tolist(), [0, 255, 0, 255])
+
+    def test_encode_ppm(self):
+        data = image.encode_ppm(self.color_buffer)
+        self.assertEqual(data, b'P6\n2 2\n255\n' + bytes([0, 255, 0, 1, 2, 3, 255, 0, 0, 0, 0, 255]))
+
+    def test_encode_png(self):
+        data = image.encode_png(self.color_buffer)
+        self.assertEqual(data[:8], b'\x89PNG\r\n\x1a\n')
+        self.assertEqual(struct.unpack('>II', data[16: 24]), (2, 2))
+
+        idat = data.index(b'IDAT')
+        length, = struct.unpack('>I', data[idat - 4: idat])
+        scanlines = zlib.decompress(data[idat + 4: idat + 4 + length])
+        self.assertEqual(scanlines, bytes([0, 0, 255, 0, 255, 1, 2, 3, 4, 0, 255, 0, 0, 255, 0, 0, 255, 255]))
+
+
+class TestFrameStreamMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.color_buffer = array([[0xffffffff, 0x000000ff], [0xff0000ff, 0x01020304], [0, 0]], dtype='uint32')
+
+    def test_raw(self):
+        output = io.BytesIO()
+        with FrameStream(output, 2, 2, 'raw', queue_size=1) as stream:
+            for _ in range(3):
+                stream.write(self.color_buffer)
+        self.assertEqual(stream.frame_count, 3)
+        self.assertEqual(output.getvalue(), image.rgba_rows(self.color_buffer[:2]).tobytes() * 3)
+
+    def test_y4m(self):
+        output = io.BytesIO()
+        with FrameStream(output, 2, 2, fps=25) as stream:
+            stream.write(self.color_buffer)
+        header, frame, planes = output.getvalue().split(b'\n', 2)
+        self.assertEqual(header, b'YUV4MPEG2 W2 H2 F25:1 Ip A1:1 C444')
+        self.assertEqual(frame, b'FRAME')
+        self.assertEqual(len(planes), 12)
+        # black and white luma, top row first
+        self.assertEqual((planes[0], planes[2]), (16, 235))
+
+        with self.assertRaises(AttributeError):
+            stream.write(self.color_buffer)
+
+
+class TestHeadlessMethods(unittest.TestCase):
+
+    def test_minimal_setup(self):
+        # a fresh interpreter with neither OpenGL nor compiled extensions renders a frame to stdout
+        script = ("import sys; sys.modules['OpenGL'] = sys.modules['softrenderer.cython'] = None; "
+                  "from softrenderer import headless; "
+                  "headless.main(['--width', '8', '--height', '8', '--frames', '1', '--format', 'raw', "
+                  "'--output', '-'])")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, '-c', script], cwd=root, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, env=dict(os.environ, PYTHONPATH=root))
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(len(result.stdout), 8 * 8 * 4)
+
+
+class TestVertexShaderMethods(unittest.TestCase):
+
+    class _ScaleVertexShader(VertexShader):
+
+        def main(self, vertex_properties):
+            return [v * 2 for v in vertex_properties] + [1]
+
+    def test_main_batch(self):
+        vertices = array([[1, 2, 3, 4], [5, 6, 7, 8]], dtype=float)
+        ret = self._ScaleVertexShader().main_batch(vertices)
+        self.assertEqual(ret.shape, (2, 5))
+        self.assertEqual(ret.tolist(), [[2, 4, 6, 8, 1], [10, 12, 14, 16, 1]])
+
+
+class TestPixelShaderMethods(unittest.TestCase):
+
+    class _RedPixelShader(PixelShader):
+
+        def main(self, pixel_properties):
+            return Color(pixel_properties[2], 0, 0, 1)
+
+    def test_main_batch(self):
+        pixel_properties = array([[0, 1, 2], [5, 5, 5], [0.25, 0.5, 1], [0, 0, 0]], dtype=float)
+        ret = self._RedPixelShader().main_batch(pixel_properties)
+        self.assertEqual(ret.shape, (4, 3))
+        self.assertEqual(ret[0].tolist(), [0.25, 0.5, 1])
+        self.assertEqual(ret[3].tolist(), [1, 1, 1])
+
+
+class TestWorkerPoolMethods(unittest.TestCase):
+
+    def setUp(self):
+        self._pool = WorkerPool(4)
+
+    def tearDown(self):
+        self._pool.shutdown()
+
+    def test_split(self):
+        units = self._pool.split(list(range(100)), 10)
+        self.assertEqual(len(units), 8)
+        self.assertEqual(sum(units, []), list(range(100)))
+        self.assertEqual(self._pool.split([1, 2, 3], 10), [[1, 2, 3]])
+
+    def test_map(self):
+        units = self._pool.split(list(range(100)))
+        ret = self._pool.map(lambda unit: [x * 2 for x in unit], units)
+        self.assertTrue(self._pool.is_running)
+        self.assertEqual(sum(ret, []), [x * 2 for x in range(100)])
+
+    def test_worker_count(self):
+        self._pool.map(len, [[1], [2]])
+        self._pool.worker_count = 2
+        self.assertFalse(self._pool.is_running)
+        self.assertRaises(AttributeError, setattr, self._pool, 'worker_count', 0)
+
+
+class TestRasterizerMethods(unittest.TestCase):
+
+    def test_edge_function_rasterize(self):
+        quad = array([[1.3, 1.7, 0, 1], [9.1, 2.2, 0, 1], [8.6, 9.4, 0, 1], [0.8, 8.9, 0, 1]])
+        pixels = set()
+        for indices in ([0, 1, 2], [0, 2, 3]):
+            xs, ys, properties = rasterizer.edge_function_rasterize(quad[indices], (0, 0, 20, 20))
+            self.assertEqual(properties.shape, (4, len(xs)))
+            triangle_pixels = set(zip(xs.tolist(), ys.tolist()))
+            self.assertFalse(pixels & triangle_pixels)
+            pixels |= triangle_pixels
+
+        # shared edge leaves no hole
+        self.assertIn((5, 5), pixels)
+        self.assertEqual(len(pixels), 56)
+
+        xs, _, _ = rasterizer.edge_function_rasterize(quad[[0, 1, 2]], (0, 0, 5, 5))
+        self.assertTrue((xs < 5).all())
+
+    def test_setup_triangles(self):
+        vertices = array([[[0, 0, 0, 1, 0], [4, 0, 0, 1, 4], [0, 2, 0, 1, 2]],
+                          [[0, 0, 0, 1, 0], [0, 2, 0, 1, 2], [4, 0, 0, 1, 4]],
+                          [[1, 1, 0, 1, 0], [2, 2, 0, 1, 0], [3, 3, 0, 1, 0]]], dtype=float)
+        setup = rasterizer.setup_triangles(vertices)
+        self.assertEqual(setup.areas.tolist(), [8, -8, 0])
+        self.assertEqual(setup.degenerate.tolist(), [False, False, True])
+        self.assertEqual(setup.one_over_areas.tolist(), [0.125, 0.125, 0])
+        self.assertEqual(setup.gradients[0, 4].tolist(), [1, 1])
+        self.assertEqual(setup.gradients[1, 4].tolist(), [1, 1])
+
+        # both windings are positive inside
+        center = array([4 / 3, 2 / 3, 1])
+        self.assertTrue((setup.edges[:2, :, :3].dot(center) > 0).all())
+
+    def test_scan_line_rasterize(self):
+        vertices = array([[[2, 2, 0, 1, 0], [8, 2, 0, 1, 6], [2, 8, 0, 1, 0]],
+                          [[0, 0, 0, 1, 0], [1, 0, 0, 1, 0], [2, 0, 0, 1, 0]]], dtype=float)
+        xs, ys, properties, triangle_ids = rasterizer.scan_line_rasterize(TriangleBatch.from_vertices(vertices),
+                                                                         (0, 0, 20, 20))
+        self.assertEqual(properties.shape, (5, len(xs)))
+        self.assertEqual(len(xs[triangle_ids == 0]), 28)
+        self.assertEqual(len(xs[triangle_ids == 1]), 3)
+        # last property follows x
+        self.assertTrue((properties[4][triangle_ids == 0] == xs[triangle_ids == 0] - 2).all())
+
+    def test_line_rasterize(self):
+        xs, ys, ts, line_ids = rasterizer.line_rasterize([[0, 0], [5, 5], [3, 9]], [[4, 2], [5, 5], [1, 3]])
+        self.assertEqual(list(zip(xs[line_ids == 0].tolist(), ys[line_ids == 0].tolist())),
+                         [(0, 0), (1, 0), (2, 1), (3, 1), (4, 2)])
+        self.assertEqual(ts[line_ids == 0].tolist(), [0, 0.25, 0.5, 0.75, 1])
+        self.assertEqual((xs[line_ids == 1].tolist(), ts[line_ids == 1].tolist()), ([5], [0]))
+        # steep line walks y from its start
+        self.assertEqual(ys[line_ids == 2].tolist(), [9, 8, 7, 6, 5, 4, 3])
+        self.assertEqual((xs[line_ids == 2][0], xs[line_ids == 2][-1]), (3, 1))
+
+    def test_bin_triangles(self):
+        positions = array([[[1, 1], [30, 1], [1, 30]], [[40, 40], [50, 40], [40, 50]], [[1, 1], [2, 1], [1, 2]]])
+        bins = rasterizer.bin_triangles(positions, 32, 70, 60)
+        self.assertEqual([rect for rect, _ in bins], [(0, 0, 32, 32), (32, 32, 64, 60)])
+        self.assertEqual(bins[0][1].tolist(), [0, 2])
+        self.assertEqual(bins[1][1].tolist(), [1])
+
+
+class TestTriangleBatchMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.vertices = array([[[0, 0, 0, 1, 0], [4, 0, 0, 1, 4], [0, 2, 0, 1, 2]],
+                               [[1, 1, 0, 1, 0], [2, 2, 0, 1, 0], [3, 3, 0, 1, 0]]], dtype=float)
+        self.batch = TriangleBatch.from_vertices(self.vertices)
+
+    def test_views(self):
+        self.assertEqual(len(self.batch), 2)
+        self.assertEqual(self.batch.properties_count, 5)
+        self.assertEqual(self.batch[0].v2.x, 4)
+        self.assertEqual(self.batch[0].v3[4], 2)
+        self.assertEqual(self.batch[1].bounding_box.tolist(), [1, 1, 3, 3])
+        self.assertTrue((self.batch.vertices == self.vertices).all())
+
+    def test_slicing(self):
+        sliced = self.batch[1:]
+        self.assertEqual(len(sliced), 1)
+        self.assertEqual(sliced[0].v1.x, 1)
+        self.assertEqual(len(self.batch[array([True, False])]), 1)
+
+    def test_gradients(self):
+        self.assertEqual(self.batch.gradients[0, 4].tolist(), [1, 1])
+        # degenerate triangle has flat planes
+        self.assertEqual(self.batch.gradients[1].tolist(), zeros((5, 2)).tolist())
+
+
+class TestVertexLayoutMethods(unittest.TestCase):
+
+    def setUp(self):
+        self._layout = VertexLayout([VertexAttribute(4, float32), VertexAttribute(4, uint8, normalized=True)])
+        self._data = bytearray(self._layout.stride * 2)
+        for i in range(2):
+            vertex = memoryview(self._data)[i * self._layout.stride:]
+            vertex[:16] = array([1, 2, 3, 4], dtype=float32).tobytes()
+            vertex[16:20] = bytes([255, 0, 51, 255])
+
+    def test_layout(self):
+        self._layout = VertexLayout([VertexAttribute(3), VertexAttribute(4, uint8, 16)], stride=24)
+        self.assertEqual(self._layout.stride, 24)
+        self.assertEqual(self._layout.attributes[1].offset, 16)
+        self.assertRaises(AttributeError, VertexLayout, [VertexAttribute(4)], 8)
+
+    def test_decode(self):
+        self.assertEqual(self._layout.stride, 20)
+        self.assertEqual(self._layout.vertex_count(self._data), 2)
+        view = self._layout.attribute_view(self._data, 1)
+        self.assertEqual(view.tolist(), [[255, 0, 51, 255]] * 2)
+        self._data[16] = 0
+        self.assertEqual(view[0, 0], 0)
+
+        ret = self._layout.decode(self._data)
+        self.assertEqual(ret.shape, (2, 8))
+        self.assertEqual(ret[1].tolist(), [1, 2, 3, 4, 1, 0, 0.2, 1])
+
+
+class TestRenderContextMethods(unittest.TestCase):
+
+    class _CountPixelShader(PixelShader):
+
+        def __init__(self):
+            self.count = 0
+
+        def main_batch(self, pixel_properties):
+            self.count += pixel_properties.shape[1]
+            return pixel_properties[2:6]
+
+    def setUp(self):
+        Profiler.config(Profiler.DISABLE)
+        RenderContext.set_screen_size(40, 40)
+        RenderContext.set_worker_count(1)
+        RenderContext.enable_depth_test(True)
+        RenderContext.clear()
+        self._shader = self._CountPixelShader()
+        RenderContext.bind_pixel_shader(self._shader)
+
+    def tearDown(self):
+        RenderContext.bind_pixel_shader(_DefaultPixelShader())
+        RenderContext.enable_depth_test(False)
+        RenderContext.set_worker_count()
+        Profiler.config(Profiler.ENABLE)
+
+    @staticmethod
+    def _triangle_vertices(z, color):
+        return [-0.8, -0.8, z, 1] + color + [0.8, -0.8, z, 1] + color + [0, 0.8, z, 1] + color
+
+    def _draw(self, vertices, index_buffer, layout=None):
+        vertex_array = VertexArray(vertices, [4, 4] if layout is None else layout, index_buffer)
+        vertex_array.bind()
+        RenderContext.draw()
+        vertex_array.un_bind()
+        vertex_array.delete()
+
+    def test_depth_test(self):
+        self._draw(self._triangle_vertices(0.5, [1, 0, 0, 1]) + self._triangle_vertices(0.8, [0, 1, 0, 1]),
+                   [0, 1, 2, 3, 4, 5])
+        color_buffer = RenderContext.color_buffer()
+        self.assertEqual(color_buffer[20, 15], 0xff0000ff)
+        self.assertAlmostEqual(float(RenderContext.depth_buffer()[20, 15]), 0.75, 5)
+        # hidden triangle is rejected before pixel shading
+        self.assertEqual(self._shader.count, (color_buffer != 0).sum())
+
+        RenderContext.depth_func(RenderContext.DepthFunc.GREATER)
+        self._draw(self._triangle_vertices(0.8, [0, 1, 0, 1]), [0, 1, 2])
+        RenderContext.depth_func(RenderContext.DepthFunc.LESS)
+        self.assertEqual(color_buffer[20, 15], 0x00ff00ff)
+
+    def test_edge_function_rasterizer(self):
+        vertices = self._triangle_vertices(0.5, [1, 0, 0, 1]) + self._triangle_vertices(0.8, [0, 1, 0, 1])
+        RenderContext.set_rasterizer(RenderContext.RasterizerType.EDGE_FUNCTION)
+        self._draw(vertices, [0, 1, 2, 3, 4, 5])
+        color_buffer = RenderContext.color_buffer().copy()
+        self.assertEqual(color_buffer[20, 15], 0xff0000ff)
+        self.assertEqual(self._shader.count, (color_buffer != 0).sum())
+
+        RenderContext.clear()
+        RenderContext.set_rasterizer(RenderContext.RasterizerType.TILED)
+        RenderContext.set_tile_size(16)
+        self._draw(vertices, [0, 1, 2, 3, 4, 5])
+        RenderContext.set_tile_size(64)
+        RenderContext.set_rasterizer(RenderContext.RasterizerType.SCAN_LINE)
+        self.assertTrue((RenderContext.color_buffer() == color_buffer).all())
+        self.assertRaises(TypeError, RenderContext.set_tile_size, 16.5)
+
+    def test_perspective_correct_interpolation(self):
+        class CapturePixelShader(PixelShader):
+
+            def main_batch(self, pixel_properties):
+                self.pixel_properties = pixel_properties
+                return pixel_properties[2:6]
+
+        capture = CapturePixelShader()
+        RenderContext.bind_pixel_shader(capture)
+        RenderContext.set_rasterizer(RenderContext.RasterizerType.EDGE_FUNCTION)
+        # second vertex is 4 times farther, its weight shrinks in screen space
+        self._draw([-0.8, -0.8, 0, 1, 0, 0, 0, 1] + [3.2, -3.2, 0, 4, 1, 0, 0, 1] + [-0.8, 0.8, 0, 1, 0, 0, 0, 1],
+                   [0, 1, 2])
+        RenderContext.set_rasterizer(RenderContext.RasterizerType.SCAN_LINE)
+
+        xs, ys, reds = capture.pixel_properties[:3]
+        red = reds[(xs == 19) & (ys == 4)][0]
+        # screen middle of the bottom edge, 0.5 if interpolated linearly
+        self.assertAlmostEqual(red, 0.2, 1)
+        self.assertTrue(abs(capture.pixel_properties[5] - 1).max() < 1e-9)
+
+    def test_buffer_objects(self):
+        red = VertexArray(self._triangle_vertices(0.5, [1, 0, 0, 1]), [4, 4], [0, 1, 2])
+        green = VertexArray(self._triangle_vertices(0.5, [0, 1, 0, 1]), [4, 4], [0, 1, 2])
+
+        # every vertex array draws its own buffers
+        red.bind()
+        RenderContext.draw()
+        red.un_bind()
+        self.assertEqual(RenderContext.color_buffer()[20, 15], 0xff0000ff)
+
+        RenderContext.clear()
+        green.bind()
+        RenderContext.draw()
+        self.assertEqual(RenderContext.color_buffer()[20, 15], 0x00ff00ff)
+
+        # rewrite the color of the first vertex only
+        RenderContext.clear()
+        green.update_vertex_buffer(4, [0, 0, 1, 1])
+        RenderContext.draw()
+        green.un_bind()
+        color_buffer = RenderContext.color_buffer()
+        self.assertGreater(int(color_buffer[5, 5]) >> 8 & 0xff, 0xd0)
+        self.assertGreater(int(color_buffer[34, 5]) >> 16 & 0xff, 0xd0)
+
+        with self.assertRaises(AttributeError):
+            green.update_vertex_buffer(20, [0] * 8)
+
+        # updating a vertex array leaves the bound one and its buffers alone
+        RenderContext.clear()
+        red.bind()
+        green.update_vertex_buffer(4, [0, 1, 0, 1])
+        self.assertEqual(RenderContext.bound_vertex_array(), red.renderer_id)
+        RenderContext.draw()
+        red.un_bind()
+        self.assertEqual(RenderContext.color_buffer()[20, 15], 0xff0000ff)
+
+        RenderContext.clear()
+        green.bind()
+        RenderContext.draw()
+        green.un_bind()
+        self.assertEqual(RenderContext.color_buffer()[20, 15], 0x00ff00ff)
+
+        red.delete()
+        green.delete()
+
+    def test_bound_vertex_array(self):
+        context = RenderContext._instance
+        RenderContext._instance = None
+        try:
+            # nothing was ever bound on a fresh context
+            self.assertEqual(RenderContext.bound_vertex_array(), 0)
+            vertex_array = VertexArray(self._triangle_vertices(0.5, [1, 0, 0, 1]), [4, 4], [0, 1, 2])
+            vertex_array.update_vertex_buffer(4, [0, 1, 0, 1])
+            self.assertEqual(RenderContext.bound_vertex_array(), 0)
+            vertex_array.delete()
+        finally:
+            RenderContext._instance = context
+
+    def test_draw_instanced(self):
+        RenderContext.enable_depth_test(False)
+        vertices = [-0.2, -0.2, 0.5, 1, 1, 1, 1, 1] + [0.2, -0.2, 0.5, 1, 1, 1, 1, 1] + [0, 0.2, 0.5, 1, 1, 1, 1, 1]
+        instances = []
+        for offset, tint in ((-0.5, [1, 0, 0, 1]), (0.5, [0, 0, 1, 1])):
+            instances += [1, 0, 0, offset, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1] + tint
+
+        vertex_array = VertexArray(vertices, [4, 4], [0, 1, 2], instances)
+        vertex_array.bind()
+        RenderContext.draw_instanced(2)
+        color_buffer = RenderContext.color_buffer()
+        self.assertEqual(color_buffer[10, 20], 0xff0000ff)
+        self.assertEqual(color_buffer[30, 20], 0x0000ffff)
+        self.assertEqual(color_buffer[20, 20], 0)
+
+        # move the second instance to the middle
+        RenderContext.clear()
+        vertex_array.update_instance_buffer(20 + 3, [0])
+        RenderContext.draw_instanced(2)
+        self.assertEqual(color_buffer[20, 20], 0x0000ffff)
+
+        with self.assertRaises(AttributeError):
+            RenderContext.draw_instanced(3)
+        vertex_array.un_bind()
+        vertex_array.delete()
+
+    def test_command_buffer(self):
+        far = VertexArray(self._triangle_vertices(0.8, [1, 0, 0, 1]), [4, 4], [0, 1, 2])
+        near = VertexArray(self._triangle_vertices(0.5, [0, 1, 0, 1]), [4, 4], [0, 1, 2])
+
+        command_buffer = CommandBuffer()
+        command_buffer.bind_pixel_shader(self._shader)
+        command_buffer.bind_vertex_array(far.renderer_id)
+        command_buffer.draw(depth_key=2)
+        command_buffer.bind_pixel_shader(self._shader)
+        command_buffer.bind_vertex_array(near.renderer_id)
+        command_buffer.draw(depth_key=1)
+        command_buffer.bind_vertex_array(0)
+
+        # one merged pass, the near triangle hides the far one before pixel shading
+        self.assertEqual(RenderContext.submit(command_buffer), 1)
+        color_buffer = RenderContext.color_buffer()
+        self.assertEqual(color_buffer[20, 15], 0x00ff00ff)
+        self.assertEqual(self._shader.count, (color_buffer != 0).sum())
+
+        # a draw without depth test is not reordered
+        RenderContext.clear()
+        command_buffer.reset()
+        command_buffer.bind_vertex_array(near.renderer_id)
+        command_buffer.draw(depth_key=1)
+        command_buffer.enable_depth_test(False)
+        command_buffer.bind_vertex_array(far.renderer_id)
+        command_buffer.draw(depth_key=2)
+        command_buffer.enable_depth_test(True)
+        command_buffer.bind_vertex_array(0)
+        self.assertEqual(RenderContext.submit(command_buffer), 2)
+        self.assertEqual(color_buffer[20, 15], 0xff0000ff)
+
+        # neither are draws with a depth function depending on draw order
+        RenderContext.clear()
+        command_buffer.reset()
+        command_buffer.depth_func(RenderContext.DepthFunc.ALWAYS)
+        command_buffer.bind_vertex_array(far.renderer_id)
+        command_buffer.draw(depth_key=5)
+        command_buffer.bind_vertex_array(near.renderer_id)
+        command_buffer.draw(depth_key=1)
+        command_buffer.depth_func(RenderContext.DepthFunc.LESS)
+        command_buffer.bind_vertex_array(0)
+        self.assertEqual(RenderContext.submit(command_buffer), 2)
+        self.assertEqual(color_buffer[20, 15], 0x00ff00ff)
+
+        # greater depths pass, the far triangle runs first and hides the near one
+        RenderContext.clear_depth(0)
+        RenderContext.clear()
+        command_buffer.reset()
+        command_buffer.depth_func(RenderContext.DepthFunc.GREATER)
+        command_buffer.bind_vertex_array(near.renderer_id)
+        command_buffer.draw(depth_key=1)
+        command_buffer.bind_vertex_array(far.renderer_id)
+        command_buffer.draw(depth_key=2)
+        command_buffer.depth_func(RenderContext.DepthFunc.LESS)
+        command_buffer.bind_vertex_array(0)
+        self.assertEqual(RenderContext.submit(command_buffer), 1)
+        RenderContext.clear_depth(1.0)
+        self.assertEqual(color_buffer[20, 15], 0xff0000ff)
+
+        far.delete()
+        near.delete()
+
+    def test_swap_buffers(self):
+        presented = []
+        RenderContext.set_present_callback(lambda front_buffer: presented.append(front_buffer.copy()))
+        back_buffer = RenderContext.color_buffer()
+        self._draw(self._triangle_vertices(0.5, [1, 0, 0, 1]), [0, 1, 2])
+        RenderContext.swap_buffers()
+        RenderContext.wait_present()
+        RenderContext.set_present_callback()
+
+        self.assertIs(RenderContext.front_buffer(), back_buffer)
+        self.assertIsNot(RenderContext.color_buffer(), back_buffer)
+        self.assertEqual(len(presented), 1)
+        self.assertEqual(presented[0][20, 15], 0xff0000ff)
+
+        # next frame renders into the other buffer
+        RenderContext.clear()
+        self.assertEqual(RenderContext.front_buffer()[20, 15], 0xff0000ff)
+        RenderContext.swap_buffers()
+
+    def test_row_major_framebuffer(self):
+        RenderContext.draw_line(Line2d(Vector2(0, 5), Vector2(39, 5)), Color.red(), Color.red())
+        self._draw(self._triangle_vertices(0.5, [1, 0, 0, 1]), [0, 1, 2])
+        color_buffer = RenderContext.color_buffer()[:40, :40].copy()
+
+        RenderContext.set_framebuffer_layout(RenderContext.FramebufferLayout.ROW_MAJOR)
+        RenderContext.draw_line(Line2d(Vector2(0, 5), Vector2(39, 5)), Color.red(), Color.red())
+        self._draw(self._triangle_vertices(0.5, [1, 0, 0, 1]), [0, 1, 2])
+        rows = RenderContext.color_buffer().transpose()
+        RenderContext.set_framebuffer_layout(RenderContext.FramebufferLayout.COLUMN_MAJOR)
+
+        self.assertEqual(rows.shape, (40, 40))
+        self.assertTrue(rows.flags['C_CONTIGUOUS'])
+        self.assertTrue((rows.T == color_buffer).all())
+
+    def test_draw_lines(self):
+        RenderContext.draw_lines([[0, 5], [10, -10], [2, 30]], [[39, 5], [10, 60], [2, 30]],
+                                 [[1, 0, 0, 1], [0, 1, 0, 1], [0, 0, 1, 1]], [[0, 0, 1, 1], [0, 1, 0, 1], [0, 0, 1, 1]])
+        color_buffer = RenderContext.color_buffer()
+        self.assertEqual(color_buffer[0, 5], 0xff0000ff)
+        self.assertEqual(color_buffer[39, 5], 0x0000ffff)
+        # off-screen part is dropped
+        self.assertEqual(color_buffer[10, 0], 0x00ff00ff)
+        self.assertEqual(color_buffer[10, 40], 0x00ff00ff)
+        self.assertEqual(color_buffer[2, 30], 0x0000ffff)
+
+        RenderContext.clear()
+        RenderContext.draw_lines([[0, 0]], [[3, 0]], [1, 1, 1, 1], [1, 1, 1, 1])
+        self.assertEqual(color_buffer[:4, 0].tolist(), [0xffffffff] * 4)
+
+    def test_clip_lines(self):
+        starts = array([[1, 1], [-5, -5], [-10, 5], [5, 5], [-10, 30], [-10, 50]], dtype=float)
+        ends = array([[9, 9], [-1, 20], [30, 5], [5, 5], [30, -10], [50, -10]], dtype=float)
+        clipped_starts, clipped_ends, accept, t0, t1 = RenderContext._clip_lines(starts, ends, (0, 0), (19, 19))
+
+        self.assertEqual(accept.tolist(), [True, False, True, True, True, False])
+        self.assertEqual(clipped_starts[0].tolist(), [1, 1])
+        self.assertEqual(clipped_ends[0].tolist(), [9, 9])
+        self.assertEqual(clipped_starts[2].tolist(), [0, 5])
+        self.assertEqual(clipped_ends[2].tolist(), [19, 5])
+        self.assertEqual(t0[2], 0.25)
+        self.assertAlmostEqual(t1[2], 0.725)
+        self.assertTrue(abs(clipped_starts[4] - [1, 19]).max() < 1e-9)
+        self.assertTrue(abs(clipped_ends[4] - [19, 1]).max() < 1e-9)
+
+    def test_draw_triangle(self):
+        RenderContext.draw_triangle(Triangle2d(Vector2(10, 30), Vector2(-10, 2), Vector2(50, 2),
+                                               Color.red(), Color.green(), Color.blue()))
+        color_buffer = RenderContext.color_buffer()
+        self.assertEqual(color_buffer[10, 30], 0xff0000ff)
+        # spans are clipped to the color buffer
+        self.assertEqual(color_buffer[0, 2], 0x00d42aff)
+        self.assertEqual(color_buffer[40, 2], 0x002ad4ff)
+        self.assertEqual(color_buffer[10, 31], 0)
+        self.assertEqual((color_buffer[:, 2] != 0).sum(), 41)
+
+    def test_typed_vertex_buffer(self):
+        RenderContext.enable_depth_test(False)
+        self._draw(self._triangle_vertices(0.5, [1, 0, 0.2, 1]), [0, 1, 2])
+        color_buffer = RenderContext.color_buffer().copy()
+
+        vertices = zeros(3, dtype=[('position', float32, 4), ('color', uint8, 4)])
+        vertices['position'] = array(self._triangle_vertices(0.5, [0, 0, 0, 0])).reshape(3, 8)[:, :4]
+        vertices['color'] = [255, 0, 51, 255]
+        layout = VertexLayout([VertexAttribute(4, float32), VertexAttribute(4, uint8, normalized=True)])
+
+        RenderContext.clear()
+        self._draw(vertices, [0, 1, 2], layout)
+        self.assertTrue((RenderContext.color_buffer() == color_buffer).all())
+
+    def test_index_buffer(self):
+        self.assertEqual(RenderContext._as_index_array([0, 1, 2]).dtype, 'uint16')
+        self.assertEqual(RenderContext._as_index_array([0, 1, 70000]).dtype, 'uint32')
+        indices = array([0, 1, 2], dtype='uint32')
+        self.assertIs(RenderContext._as_index_array(indices), indices)
+        self.assertRaises(TypeError, RenderContext._as_index_array, [0, -1, 2])
+
+    def test_clipping(self):
+        vertices = array([[0, 0, 0, 1], [2, 0, 0, 1], [0, 0.5, 0, 1],
+                          [3, 0, 0, 1], [4, 0, 0, 1], [3, 1, 0, 1]], dtype=float)
+        ret, triangle_indices = RenderContext.instance()._clipping(vertices, array([[0, 1, 2], [3, 4, 5]]))
+        self.assertEqual(triangle_indices.shape, (2, 3))
+        self.assertEqual(ret.shape, (8, 4))
+        self.assertTrue((ret[triangle_indices.ravel(), 0] <= 1).all())
+
+        self._draw([-3, -3, 0, 1, 1, 0, 0, 1, 3, -3, 0, 1, 1, 0, 0, 1, 0, 3, 0, 1, 1, 0, 0, 1,
+                    5, 5, 0, 1, 0, 1, 0, 1, 6, 5, 0, 1, 0, 1, 0, 1, 5, 6, 0, 1, 0, 1, 0, 1], [0, 1, 2, 3, 4, 5])
+        color_buffer = RenderContext.color_buffer()
+        self.assertEqual(color_buffer[20, 20], 0xff0000ff)
+        self.assertEqual(color_buffer[0, 0], 0xff0000ff)
+        self.assertFalse((color_buffer == 0x00ff00ff).any())
+
+        # clipped triangles keep their place in the draw order
+        RenderContext.clear()
+        RenderContext.enable_depth_test(False)
+        self._draw([-3, -3, 0, 1, 1, 0, 0, 1, 3, -3, 0, 1, 1, 0, 0, 1, 0, 3, 0, 1, 1, 0, 0, 1]
+                   + self._triangle_vertices(0.5, [0, 1, 0, 1]), [0, 1, 2, 3, 4, 5])
+        self.assertEqual(color_buffer[20, 20], 0x00ff00ff)
+        self.assertEqual(color_buffer[0, 0], 0xff0000ff)
+
+    def test_culling(self):
+        RenderContext.enable_depth_test(False)
+        vertices = self._triangle_vertices(0.5, [1, 0, 0, 1]) + [0.5, 0.5, 0.5, 1, 0, 0, 1, 1,
+                                                                  0.5, 0.5, 0.5, 1, 0, 0, 1, 1]
+        # counter-clockwise, clockwise, zero area
+        index_buffer = [0, 1, 2, 0, 2, 1, 3, 4, 0]
+
+        RenderContext.cull_face(RenderContext.CullFace.BACK)
+        self._draw(vertices, index_buffer)
+        RenderContext.cull_face(RenderContext.CullFace.NONE)
+        self.assertEqual(self._shader.count, (RenderContext.color_buffer() != 0).sum())
+
+        RenderContext.clear()
+        RenderContext.cull_face(RenderContext.CullFace.FRONT)
+        self._draw(vertices, index_buffer[:3])
+        RenderContext.cull_face(RenderContext.CullFace.NONE)
+        self.assertFalse(RenderContext.color_buffer().any())
+
+
 if __name__ == '__main__':
     pass